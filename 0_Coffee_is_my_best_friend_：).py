@@ -5,17 +5,28 @@ from datetime import datetime
 import time
 
 # Import refactored modules
-from database import get_data, insert_click, get_transactions, insert_transaction, get_preferences, save_user_preference
+from database import (
+    get_data, 
+    get_transactions, 
+    get_preferences, 
+    get_click_totals,
+    get_transaction_totals,
+    get_write_queue_status,
+    WriteBatch
+)
 from data_processing import (
     process_raw_data, 
     get_gamification_metrics, 
+    get_crew_progress,
     get_user_titles, 
     resolve_user_title,
-    get_coin_balances, 
+    get_coin_balances_from_totals, 
+    get_scores_from_totals,
     get_active_perks, 
     get_user_preferences
 )
 from utils import enforce_user_identity
+from drinks import COFFEE_MG, TEA_MG, caffeine_mg
 from world_data import (
     TRAVEL_COUNTRIES, 
     get_country_options, 
@@ -37,7 +48,9 @@ from components.ui import (
 )
 from components.celebrations import (
     get_user_achievement_snapshot, 
+    get_unlock_delta,
     compute_new_unlocks, 
+    compute_delta_unlocks,
     trigger_celebration_popup_if_pending,
     get_ui_2_0_welcome_payload
 )
@@ -50,10 +63,15 @@ users = ["Cris", "Bea", "Fer"]
 selected_user = enforce_user_identity(users)
 
 # 2. Data Fetching & Processing
+# Header coins and leaderboard scores come from backend aggregates, not the full history
+click_totals = get_click_totals()
+coffee_scores, tea_scores = get_scores_from_totals(click_totals)
+coin_balances = get_coin_balances_from_totals(click_totals, get_transaction_totals(), users)
+
 data = get_data()
 transactions = get_transactions()
 db_prefs = get_preferences()
-df, df_coffee, df_tea, coffee_scores, tea_scores = process_raw_data(data, users)
+df, df_coffee, df_tea, _, _ = process_raw_data(data, users)
 
 prefs = get_user_preferences(transactions, users, db_preferences=db_prefs)
 user_theme = prefs.get(selected_user, {}).get("theme", "Latte (Light)")
@@ -67,7 +85,6 @@ if is_unlocked("world_update"):
     trigger_celebration_popup_if_pending(selected_user)
 
 trophies = get_gamification_metrics(df_coffee, df_tea, users)
-coin_balances = get_coin_balances(df, transactions, users)
 active_perks = get_active_perks(transactions, users)
 
 user_coins = coin_balances.get(selected_user, 0)
@@ -87,6 +104,17 @@ render_app_header(
 # --- 1.1 Standalone Daily Trivia Quote (Outside the header box) ---
 render_daily_fact_quote()
 
+# --- 1.2 Journaled taps the backend rejected for good (set aside, not retried) ---
+failed_writes = get_write_queue_status(selected_user)["failed"]
+if failed_writes:
+    lost_drinks = sum(len(e["payload"].get("clicks", [])) for e in failed_writes)
+    lost_coins = sum(len(e["payload"].get("coin_transactions", [])) for e in failed_writes)
+    st.warning(
+        f"⚠️ {len(failed_writes)} of your recent taps could not be saved "
+        f"({lost_drinks} drink logs, {lost_coins} coin entries left unwritten). "
+        f"Last error: `{failed_writes[-1]['last_error']}`"
+    )
+
 # --- Time Context (with simulation support) ---
 now = get_current_madrid_time() if df.empty else get_current_madrid_time()
 unlock_time = pd.Timestamp("2026-08-15 00:00:00", tz="Europe/Madrid")
@@ -266,12 +294,9 @@ today_iced_teas = 0
 today_df = pd.DataFrame()
 
 if not df.empty:
-    if df["created_at"].dt.tz is None:
-        df["created_at"] = df["created_at"].dt.tz_localize("UTC")
-    df["created_at"] = df["created_at"].dt.tz_convert("Europe/Madrid")
-    
+    # Madrid-local times come precomputed (created_at_local): the shared frame is read, never rewritten
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    today_df = df[df["created_at"] >= today_start]
+    today_df = df[df["created_at_local"] >= today_start]
     
     today_hot_coffees = int(today_df[today_df["drink_id"] == 1]["value"].sum()) if not today_df.empty else 0
     today_iced_coffees = int(today_df[today_df["drink_id"] == 3]["value"].sum()) if not today_df.empty else 0
@@ -283,7 +308,7 @@ if not df.empty:
 
 # Selected user today's caffeine
 user_today = today_df[today_df["user_name"] == selected_user] if not today_df.empty else pd.DataFrame()
-user_caff_today = (int(user_today[user_today["drink_id"].isin([1, 3])]["value"].sum()) * 95) + (int(user_today[user_today["drink_id"].isin([2, 4])]["value"].sum()) * 35) if not user_today.empty else 0
+user_caff_today = int(caffeine_mg(user_today["drink_id"], user_today["value"]).sum()) if not user_today.empty else 0
 
 # Cooldown check for selected user
 last_click_time = None
@@ -297,15 +322,18 @@ def handle_drink_log(drink_id, drink_name, temp_name, country_code, city_name):
         st.warning(f"Wait {int(60 - (now - last_click_time).total_seconds())}s before logging again!")
         return
     try:
-        # 0. Capture Before Snapshot for celebration detection
-        before_snapshot = get_user_achievement_snapshot(selected_user, df_coffee, df_tea, transactions, users)
+        # 0. Running crew state (folded up to the latest sync) for celebration detection
+        progress = get_crew_progress(df, users)
 
-        # 1. Insert Click Record (location is strictly null before Drop 1 unlocks)
+        # All writes for this tap are queued and sent as one bulk insert per table at the end
+        batch = WriteBatch()
+
+        # 1. Queue Click Record (location is strictly null before Drop 1 unlocks)
         log_country = country_code if is_unlocked("world_update") else None
         log_city = city_name if is_unlocked("world_update") else None
-        insert_click(selected_user, 1, drink_id, country=log_country, city=log_city)
+        batch.add_click(selected_user, 1, drink_id, country=log_country, city=log_city)
         
-        # 2. Insert Coin Transaction with explicit temperature metadata
+        # 2. Queue Coin Transaction with explicit temperature metadata
         tx_meta = {
             "drink": drink_name.lower(), 
             "temperature": temp_name.lower(), 
@@ -315,27 +343,32 @@ def handle_drink_log(drink_id, drink_name, temp_name, country_code, city_name):
             tx_meta["country"] = country_code
             tx_meta["city"] = city_name
             
-        insert_transaction(
+        batch.add_transaction(
             selected_user, 
             10, 
             "drink_log", 
             tx_meta
         )
 
-        # 3. Capture After Snapshot & Detect Unlocks
-        fresh_data = get_data()
-        fresh_tx = get_transactions()
-        fresh_df, fresh_coffee, fresh_tea, _, _ = process_raw_data(fresh_data, users)
-        after_snapshot = get_user_achievement_snapshot(selected_user, fresh_coffee, fresh_tea, fresh_tx, users)
+        # 3. Detect Unlocks: what folding the queued click into the running state changed for this user
+        fresh_tx = transactions + batch.pending_rows("coin_transactions")
+        unlock_delta = get_unlock_delta(selected_user, progress, batch.pending_rows("clicks"))
 
         new_unlocks = []
         if is_unlocked("world_update"):
-            new_unlocks = compute_new_unlocks(
-                selected_user, 
-                before_snapshot, 
-                after_snapshot, 
-                transactions=fresh_tx
-            )
+            if unlock_delta is not None:
+                new_unlocks = compute_delta_unlocks(selected_user, unlock_delta, transactions=fresh_tx)
+            else:
+                # The device clock is behind the latest synced log: diff full-history snapshots instead
+                before_snapshot = get_user_achievement_snapshot(selected_user, df_coffee, df_tea, transactions, users)
+                fresh_df, fresh_coffee, fresh_tea, _, _ = process_raw_data(data + batch.pending_rows("clicks"), users)
+                after_snapshot = get_user_achievement_snapshot(selected_user, fresh_coffee, fresh_tea, fresh_tx, users)
+                new_unlocks = compute_new_unlocks(
+                    selected_user, 
+                    before_snapshot, 
+                    after_snapshot, 
+                    transactions=fresh_tx
+                )
 
             # Automatic first-time Welcome to UI 2.0 celebration & feature tour trigger on first drink logged in UI 2.0
             user_seen_ui2 = prefs.get(selected_user, {}).get("has_seen_ui_2_0", False)
@@ -343,13 +376,13 @@ def handle_drink_log(drink_id, drink_name, temp_name, country_code, city_name):
                 if new_unlocks is None:
                     new_unlocks = []
                 new_unlocks.extend(get_ui_2_0_welcome_payload(selected_user))
-                save_user_preference(selected_user, {"has_seen_ui_2_0": True})
+                batch.add_preference(selected_user, {"has_seen_ui_2_0": True})
 
             if new_unlocks:
                 st.session_state["celebration_unlocks"] = new_unlocks
                 for item in new_unlocks:
                     if item.get("reward_coins", 0) > 0:
-                        insert_transaction(
+                        batch.add_transaction(
                             selected_user, 
                             item["reward_coins"], 
                             "shop", 
@@ -360,6 +393,9 @@ def handle_drink_log(drink_id, drink_name, temp_name, country_code, city_name):
                             }
                         )
 
+        # 4. Journal the whole tap (click, drink log + reward coins, preferences); a background flusher writes it
+        batch.commit(defer=True)
+
         if "tea" in drink_name.lower():
             st.snow()
         else:
@@ -446,7 +482,7 @@ def render_beverage_logging_section(selected_user, active_perks, prefs):
     with b_col1:
         with st.container(border=True):
             st.markdown("### ☕ Coffee Section")
-            st.caption("Rich roast &bull; **95mg** Caffeine &bull; 🪙 `+10 Coins`")
+            st.caption(f"Rich roast &bull; **{COFFEE_MG}mg** Caffeine &bull; 🪙 `+10 Coins`")
             
             c_btn1, c_btn2 = st.columns(2)
             with c_btn1:
@@ -460,7 +496,7 @@ def render_beverage_logging_section(selected_user, active_perks, prefs):
     with b_col2:
         with st.container(border=True):
             st.markdown("### 🍵 Tea Section")
-            st.caption("Fresh steep &bull; **35mg** Caffeine &bull; 🪙 `+10 Coins`")
+            st.caption(f"Fresh steep &bull; **{TEA_MG}mg** Caffeine &bull; 🪙 `+10 Coins`")
             
             t_btn1, t_btn2 = st.columns(2)
             with t_btn1:
@@ -509,7 +545,7 @@ for idx, user in enumerate(users):
     caff = 0
     if not today_df.empty:
         user_logs = today_df[today_df["user_name"] == user]
-        caff = (int(user_logs[user_logs["drink_id"].isin([1, 3])]["value"].sum()) * 95) + (int(user_logs[user_logs["drink_id"].isin([2, 4])]["value"].sum()) * 35)
+        caff = int(caffeine_mg(user_logs["drink_id"], user_logs["value"]).sum())
         
     prog_val = min(caff, 400) / 400.0
     u_streak = trophies.get("streaks", {}).get(user, 0)
@@ -583,7 +619,7 @@ with feed_col:
                         c_name = c_info.get("name", c_code)
                         loc_html = f" in **{c_city_display}, {c_name}** {get_flag_img_html(c_code, 16, 12)}"
                 
-                t = row["created_at"]
+                t = row["created_at_local"]
                 diff = now - t
                 mins = int(diff.total_seconds() / 60)
                 if mins < 1:
@@ -2,7 +2,15 @@ import streamlit as st
 import pandas as pd
 import time
 from database import save_user_preference, insert_transaction
-from data_processing import get_gamification_metrics, SECRET_FEATS
+from data_processing import get_gamification_metrics, SECRET_FEATS, ACHIEVEMENT_TIERS
+
+# Crown title awarded for each monarch entry of the trophies dict
+CROWN_TITLES = {
+    "caffeine_addict": "👑 Caffeine Monarch",
+    "tea_purist": "🍵 Tea Dynasty Sovereign",
+    "ice_monarch": "🧊 Sub-Zero Monarch",
+    "combustion_monarch": "🔥 Combustion Monarch"
+}
 
 def get_user_achievement_snapshot(user, df_coffee, df_tea, transactions, users):
     """
@@ -26,24 +34,70 @@ def get_user_achievement_snapshot(user, df_coffee, df_tea, transactions, users):
         if is_unlocked:
             unlocked_secrets.add(feat_id)
             
-    # Crowns / Monarch titles
-    crowns = set()
-    if trophies.get("caffeine_addict") == user:
-        crowns.add("👑 Caffeine Monarch")
-    if trophies.get("tea_purist") == user:
-        crowns.add("🍵 Tea Dynasty Sovereign")
-    if trophies.get("ice_monarch") == user:
-        crowns.add("🧊 Sub-Zero Monarch")
-    if trophies.get("combustion_monarch") == user:
-        crowns.add("🔥 Combustion Monarch")
-        
     return {
         "tiers": unlocked_tiers,
         "secrets": unlocked_secrets,
-        "crowns": crowns,
+        "crowns": _user_crowns(user, trophies),
         "trophies": trophies
     }
 
+def _user_crowns(user, trophies):
+    """Crown titles `user` holds (the ice and combustion monarchs are {"user", "count"} dicts)."""
+    crowns = set()
+    for key, crown in CROWN_TITLES.items():
+        holder = trophies.get(key)
+        if isinstance(holder, dict):
+            holder = holder.get("user")
+        if holder == user:
+            crowns.add(crown)
+    return crowns
+
+def get_unlock_delta(user, progress, click_rows):
+    """
+    What the user's new click rows unlock, from a running CrewProgress alone: folds `click_rows`
+    into `progress` and compares only that user's track values, secret feats and the crowns
+    before and after, so the work is one event's, not the history's. Returns a dict with:
+    - tiers: list of newly reached (track_id, tier_level, tier_name)
+    - previous_tiers: track_id -> (tier_level, tier_name) held before, for upgraded tracks
+    - secrets: set of new feat_ids
+    - crowns: set of newly gained crown titles
+    Returns None if a row predates the user's latest log (recompute with snapshots instead).
+    The theme-based chromatic_sovereign feat never changes with a click and is not checked.
+    """
+    season = progress.season_progress(user)
+    before_stats = season.stats_map()
+    before_secrets = season.secrets()
+    before_crowns = _user_crowns(user, progress.crowns())
+
+    if not all(progress.fold_click(row) for row in click_rows):
+        return None
+    season = progress.season_progress(user)
+    after_stats = season.stats_map()
+    after_secrets = season.secrets()
+    after_crowns = _user_crowns(user, progress.crowns())
+
+    # Tiers are listed in ascending target order: a tier is crossed when before < target <= after
+    new_tiers = []
+    previous_tiers = {}
+    for track_id, track_data in ACHIEVEMENT_TIERS.items():
+        before_val = before_stats.get(track_id, 0)
+        after_val = after_stats.get(track_id, 0)
+        held = None
+        for tier in track_data["tiers"]:
+            if before_val >= tier["target"]:
+                held = (tier["level"], tier["name"])
+            elif after_val >= tier["target"]:
+                new_tiers.append((track_id, tier["level"], tier["name"]))
+                if held:
+                    previous_tiers[track_id] = held
+
+    return {
+        "tiers": new_tiers,
+        "previous_tiers": previous_tiers,
+        "secrets": {feat_id for feat_id, unlocked in after_secrets.items() if unlocked and not before_secrets.get(feat_id)},
+        "crowns": after_crowns - before_crowns
+    }
+
 def get_dev_test_payload(user):
     """Test payload for basic dev unlock demonstration."""
     return [{
@@ -105,6 +159,26 @@ def compute_new_unlocks(user, before_snapshot, after_snapshot, is_dev_test=False
     """
     Compares snapshots and returns a list of celebration items with weekly crown limits and upgrade detection.
     """
+    new_tiers = after_snapshot["tiers"] - before_snapshot["tiers"]
+    # Highest tier held before, per track, to detect upgrades
+    previous_tiers = {}
+    for track_id, track_data in ACHIEVEMENT_TIERS.items():
+        for tier in track_data["tiers"]:
+            if (track_id, tier["level"], tier["name"]) in before_snapshot["tiers"]:
+                previous_tiers[track_id] = (tier["level"], tier["name"])
+    delta = {
+        "tiers": new_tiers,
+        "previous_tiers": previous_tiers,
+        "secrets": after_snapshot["secrets"] - before_snapshot["secrets"],
+        "crowns": after_snapshot["crowns"] - before_snapshot["crowns"]
+    }
+    return compute_delta_unlocks(user, delta, is_dev_test=is_dev_test, transactions=transactions)
+
+def compute_delta_unlocks(user, delta, is_dev_test=False, transactions=None):
+    """
+    Celebration items (with coin rewards, upgrade detection and the once-per-lifetime crown bonus)
+    for an unlock delta from get_unlock_delta.
+    """
     unlocks = []
     
     # Dev test trigger (generic dev mode testing)
@@ -112,11 +186,8 @@ def compute_new_unlocks(user, before_snapshot, after_snapshot, is_dev_test=False
         unlocks.extend(get_dev_test_payload(user))
         
     # 1. New Tiers & Tier Upgrades
-    new_tiers = after_snapshot["tiers"] - before_snapshot["tiers"]
-    # Map before_snapshot tiers by track_id to detect upgrades
-    prev_track_tiers = {}
-    for track_id, level, name in before_snapshot["tiers"]:
-        prev_track_tiers[track_id] = (level, name)
+    new_tiers = delta["tiers"]
+    prev_track_tiers = delta["previous_tiers"]
 
     for track_id, level, name in new_tiers:
         coins = 50 if level in ["Bronze", "Silver"] else (100 if level == "Gold" else 200)
@@ -147,7 +218,7 @@ def compute_new_unlocks(user, before_snapshot, after_snapshot, is_dev_test=False
         })
         
     # 2. New Secret Feats
-    new_secrets = after_snapshot["secrets"] - before_snapshot["secrets"]
+    new_secrets = delta["secrets"]
     secret_map = {f["id"]: f for f in SECRET_FEATS}
     for feat_id in new_secrets:
         f_info = secret_map.get(feat_id, {"title": feat_id, "desc": "Arcane secret unlocked!"})
@@ -165,7 +236,7 @@ def compute_new_unlocks(user, before_snapshot, after_snapshot, is_dev_test=False
         })
         
     # 3. New Monarch Crowns (Coin Bonus awarded ONLY once in lifetime per crown)
-    new_crowns = after_snapshot["crowns"] - before_snapshot["crowns"]
+    new_crowns = delta["crowns"]
     
     for crown in new_crowns:
         # Check if user has EVER received bonus coins for this crown
@@ -130,7 +130,7 @@ def plot_hourly_distribution(df, title="24-Hour Circadian Rhythm (Peak Hours)"):
     df_copy["created_at"] = df_copy["created_at"].dt.tz_convert("Europe/Madrid")
     
     df_copy["hour"] = df_copy["created_at"].dt.hour
-    hourly_counts = df_copy.groupby(["user_name", "hour"])["value"].sum().reset_index()
+    hourly_counts = df_copy.groupby(["user_name", "hour"], observed=True)["value"].sum().reset_index()
     
     chart = alt.Chart(hourly_counts).mark_bar(
         cornerRadiusTopLeft=5, 
@@ -169,7 +169,7 @@ def plot_weekday_distribution(df, title="Weekday Volume Breakdown"):
     df_copy["weekday_num"] = df_copy["created_at"].dt.dayofweek
     df_copy["weekday_name"] = df_copy["created_at"].dt.day_name()
     
-    weekday_counts = df_copy.groupby(["user_name", "weekday_num", "weekday_name"])["value"].sum().reset_index()
+    weekday_counts = df_copy.groupby(["user_name", "weekday_num", "weekday_name"], observed=True)["value"].sum().reset_index()
     
     chart = alt.Chart(weekday_counts).mark_bar(
         cornerRadiusTopLeft=5,
@@ -220,8 +220,8 @@ def plot_average_weekday_distribution(df, title="Average Drinks per Weekday", mo
     
     if mode == "raw":
         # Raw Average: Total Drinks on that weekday / Distinct active days user logged on that weekday
-        user_active_days = df_copy.groupby(["user_name", "weekday_num", "weekday_name"])["date_only"].nunique().reset_index(name="active_days")
-        weekday_sums = df_copy.groupby(["user_name", "weekday_num", "weekday_name"])["value"].sum().reset_index()
+        user_active_days = df_copy.groupby(["user_name", "weekday_num", "weekday_name"], observed=True)["date_only"].nunique().reset_index(name="active_days")
+        weekday_sums = df_copy.groupby(["user_name", "weekday_num", "weekday_name"], observed=True)["value"].sum().reset_index()
         merged = pd.merge(complete_df, weekday_sums, on=["user_name", "weekday_num", "weekday_name"], how="left").fillna({"value": 0})
         merged = pd.merge(merged, user_active_days, on=["user_name", "weekday_num", "weekday_name"], how="left").fillna({"active_days": 1})
         merged["average"] = merged.apply(lambda r: r["value"] / r["active_days"] if r["value"] > 0 else 0.0, axis=1)
@@ -239,7 +239,7 @@ def plot_average_weekday_distribution(df, title="Average Drinks per Weekday", mo
             date_range = pd.date_range(start_date, start_date + pd.Timedelta(days=1), inclusive="left")
             
         total_weekdays = date_range.day_name().value_counts()
-        weekday_sums = df_copy.groupby(["user_name", "weekday_num", "weekday_name"])["value"].sum().reset_index()
+        weekday_sums = df_copy.groupby(["user_name", "weekday_num", "weekday_name"], observed=True)["value"].sum().reset_index()
         weekday_sums = pd.merge(complete_df, weekday_sums, on=["user_name", "weekday_num", "weekday_name"], how="left").fillna({"value": 0})
         weekday_sums['average'] = weekday_sums.apply(lambda r: r['value'] / total_weekdays.get(r['weekday_name'], 1) if total_weekdays.get(r['weekday_name'], 1) > 0 else 0.0, axis=1)
         y_title = "Avg Drinks / Calendar Day"
@@ -318,11 +318,11 @@ def plot_hot_vs_iced_distribution(df, title="Temperature Duel: Hot vs. Iced"):
     
     st.altair_chart(chart, use_container_width=True)
 
-def plot_cumulative_projections(df_filtered, p_start, p_end, chart_users, title):
+def plot_cumulative_projections(df_filtered, p_start, p_end, chart_users, title, label_drinks=False):
     """Plots actual cumulative line with dotted linear regression projection to end of period."""
     from data_processing import get_cumulative_data
     now = pd.Timestamp.now(tz="Europe/Madrid")
-    trend_df = get_cumulative_data(df_filtered, p_start, now, chart_users, "D")
+    trend_df = get_cumulative_data(df_filtered, p_start, now, chart_users, "D", label_drinks=label_drinks)
     
     if trend_df.empty:
         st.info("No trend data to project.")
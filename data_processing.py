@@ -1,5 +1,9 @@
+import threading
+import numpy as np
 import streamlit as st
 import pandas as pd
+from dataset_keys import DATASET_HASH_FUNCS, tag_frame, registered_key
+from drinks import DRINK_TABLE, COFFEE_MG, COFFEE_COST, TEA_MG, TEA_COST
 from world_data import (
     TRAVEL_COUNTRIES, 
     DEFAULT_COUNTRY, 
@@ -17,12 +21,51 @@ from gamification import (
     compute_monarch_hall_of_fame,
     compute_all_trophy_hall_of_fames,
     get_gamification_metrics,
+    get_crew_progress,
     get_user_titles,
     resolve_user_title
 )
 
-@st.cache_data(show_spinner=False)
+# Column dtypes of the event frame built by process_raw_data
+EVENT_DTYPES = {
+    "user_name": "category",
+    "country": "category",
+    "city": "category",
+    "drink_id": "int8",
+    "value": "int32"
+}
+
+def _copy_on_write() -> bool:
+    """Whether pandas copy-on-write is in effect (always from pandas 3, opt-in before)."""
+    return int(pd.__version__.split(".")[0]) >= 3 or pd.get_option("mode.copy_on_write") is True
+
 def process_raw_data(data, users):
+    """
+    Returns (df, df_coffee, df_tea, coffee_scores, tea_scores). The frames are built once per
+    dataset in a process-wide store and every caller gets shallow views of them: no per-session
+    copy, and under pandas copy-on-write a caller's edits never reach the shared frames. Older
+    pandas running without copy-on-write gets deep copies instead.
+    The frames are tagged with the dataset key (dataset_keys.tag_frame): never edit them in place,
+    copy first, or downstream caches keep serving results of the unedited data.
+    """
+    df, df_coffee, df_tea, coffee_scores, tea_scores = _process_raw_data_shared(data, users)
+    deep = not _copy_on_write()
+    views = [df.copy(deep=deep), df_coffee.copy(deep=deep), df_tea.copy(deep=deep)]
+    version = getattr(data, "version", None)
+    if version is not None:
+        # Views of a versioned snapshot hash by that version in downstream caches (see dataset_keys)
+        views = [tag_frame(view, (version, part)) for view, part in zip(views, ("all", "coffee", "tea"))]
+    return views[0], views[1], views[2], dict(coffee_scores), dict(tea_scores)
+
+def _extract_locations(locations: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """Country and city of every JSON location dict, decoded column-wise (non-dicts give None)."""
+    locations = locations.astype(object).where(locations.map(type).eq(dict), None)
+    return locations.str.get("country"), locations.str.get("city")
+
+@st.cache_resource(show_spinner=False, max_entries=8, hash_funcs=DATASET_HASH_FUNCS)
+def _process_raw_data_shared(data, _users):
+    # Keyed on the dataset alone (Streamlit skips underscore arguments): the frames and the
+    # decoded locations are built once per dataset version whoever the crew list is
     if not data:
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), {}, {}
 
@@ -36,62 +79,207 @@ def process_raw_data(data, users):
     
     # Convert timestamps
     if not df.empty and "created_at" in df.columns:
-        df["created_at"] = pd.to_datetime(df["created_at"], utc=True)
+        df["created_at"] = pd.to_datetime(df["created_at"], utc=True, format="ISO8601")
 
     # Extract location (country & city) from JSON or dedicated columns if present
-    if not df.empty:
-        if "location" in df.columns:
-            def _extract_loc(loc):
-                if isinstance(loc, dict):
-                    return loc.get("country"), loc.get("city")
-                return None, None
-            loc_tuples = df["location"].apply(_extract_loc)
-            if "country" not in df.columns or df["country"].isna().all():
-                df["country"] = [t[0] for t in loc_tuples]
-            else:
-                df["country"] = df["country"].fillna(pd.Series([t[0] for t in loc_tuples], index=df.index))
-                
-            if "city" not in df.columns or df["city"].isna().all():
-                df["city"] = [t[1] for t in loc_tuples]
+    if not df.empty and "location" in df.columns:
+        loc_country, loc_city = _extract_locations(df["location"])
+        for col, from_loc in (("country", loc_country), ("city", loc_city)):
+            if col not in df.columns or df[col].isna().all():
+                df[col] = from_loc
             else:
-                df["city"] = df["city"].fillna(pd.Series([t[1] for t in loc_tuples], index=df.index))
-    
+                df[col] = df[col].fillna(from_loc)
+
+    # Compact event dtypes: categorical names and places, small ints, and the Madrid-local
+    # timestamp every daily/hourly metric is bucketed by (group on the categoricals with observed=True)
+    if "value" in df.columns:
+        df["value"] = df["value"].fillna(1)
+    df = df.astype({col: dtype for col, dtype in EVENT_DTYPES.items() if col in df.columns})
+    if "created_at" in df.columns:
+        df["created_at_local"] = df["created_at"].dt.tz_convert("Europe/Madrid")
+
     # Separate Dataframes (1: Hot Coffee, 3: Iced Coffee, 2: Hot Tea, 4: Iced Tea)
     df_coffee = df[df["drink_id"].isin([1, 3])]
     df_tea = df[df["drink_id"].isin([2, 4])]
     
     # Calculate Scores
-    coffee_scores = df_coffee.groupby("user_name")["value"].sum().to_dict()
-    tea_scores = df_tea.groupby("user_name")["value"].sum().to_dict()
+    coffee_scores = df_coffee.groupby("user_name", observed=True)["value"].sum().to_dict()
+    tea_scores = df_tea.groupby("user_name", observed=True)["value"].sum().to_dict()
 
     return df, df_coffee, df_tea, coffee_scores, tea_scores
 
-@st.cache_data(show_spinner=False)
-def get_cumulative_data(data, start_date, end_date, users, freq="D"):
+def _daily_counts(df: pd.DataFrame) -> pd.DataFrame:
+    """Drinks per Madrid-local calendar day (naive midnight index) and (user_name, drink_id) column."""
+    if df.empty:
+        return pd.DataFrame(columns=pd.MultiIndex.from_tuples([], names=["user_name", "drink_id"]), dtype="int64")
+    local = df["created_at_local"] if "created_at_local" in df.columns else df["created_at"].dt.tz_convert("Europe/Madrid")
+    day = local.dt.tz_localize(None).dt.normalize().rename("day")
+    counts = df.groupby([day, df["user_name"].astype(str), df["drink_id"]], observed=True)["value"].sum()
+    return counts.astype("int64").unstack(["user_name", "drink_id"], fill_value=0)
+
+def _stored_rows(df: pd.DataFrame) -> int:
+    """Length of the stored prefix of an event frame (queued rows have no id and always come last)."""
+    stored = df["id"].notna().to_numpy()
+    return len(stored) - int(np.argmax(stored[::-1])) if stored.any() else 0
+
+@st.cache_resource(show_spinner=False)
+def _get_rollup_store() -> dict:
+    """Process-wide daily rollups of the shared event frames, one per dataset and drink split."""
+    return {"entries": {}, "lock": threading.Lock()}
+
+def get_daily_rollup(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Daily (day x user_name x drink_id) drink counts of an event frame from process_raw_data.
+    For the shared frames the rollup of the rows already stored is kept across dataset versions
+    and only the newly synced rows are folded in; queued rows not stored yet (no id, always last)
+    are added on top per call. Any other frame is rolled up from scratch.
+    """
+    key = registered_key(df)
+    if key is None or "id" not in df.columns:
+        return _daily_counts(df)
+    (source, table, (generation, _), columns), part = key
+    store = _get_rollup_store()
+    with store["lock"]:
+        entry = store["entries"].setdefault((source, table, generation, columns, part), {"rows": 0, "last_id": None, "daily": None, "lock": threading.Lock()})
+    with entry["lock"]:
+        n_stored = _stored_rows(df)
+        n_done = entry["rows"]
+        if entry["daily"] is None or n_done > n_stored or (n_done and df["id"].iloc[n_done - 1] != entry["last_id"]):
+            # First build, or the table was re-read from scratch: roll up everything stored
+            n_done = 0
+            entry["daily"] = _daily_counts(df.iloc[:0])
+        if n_stored > n_done:
+            entry["daily"] = entry["daily"].add(_daily_counts(df.iloc[n_done:n_stored]), fill_value=0).fillna(0).astype("int64")
+            entry["rows"], entry["last_id"] = n_stored, df["id"].iloc[n_stored - 1]
+        daily = entry["daily"]
+    if n_stored < len(df):
+        daily = daily.add(_daily_counts(df.iloc[n_stored:]), fill_value=0).fillna(0).astype("int64")
+    return daily
+
+def _monthly_records(daily: pd.DataFrame) -> list:
+    """Coffee and Tea monarch of every month of a daily rollup, newest month first."""
+    if daily.empty:
+        return []
+    counts = daily.stack(["user_name", "drink_id"])
+    counts = counts[counts > 0]
+    if counts.empty:
+        return []
+    days = counts.index.get_level_values("day")
+    drink_ids = counts.index.get_level_values("drink_id")
+    # 1. One pass: drinks per (month, category, user); the user index is sorted, so idxmax breaks ties by name
+    totals = counts.groupby([
+        days.to_period("M").rename("month"),
+        drink_ids.map(DRINK_TABLE["category"]).rename("category"),
+        counts.index.get_level_values("user_name")
+    ]).sum()
+    best = totals.groupby(level=["month", "category"]).idxmax()
+
+    # 2. One record per month
+    records = []
+    for month in sorted(totals.index.get_level_values("month").unique(), reverse=True):
+        top = {}
+        for category in ("coffee", "tea"):
+            key = best.get((month, category))
+            top[category] = f"{key[2]} ({int(totals[key])})" if key is not None else "-"
+        records.append({
+            "Month": month.strftime("%B %Y"),
+            "☕ Coffee Monarch": top["coffee"],
+            "🍵 Tea Monarch": top["tea"]
+        })
+    return records
+
+@st.cache_resource(show_spinner=False)
+def _get_monthly_store() -> dict:
+    """Process-wide monthly monarch history of the shared event frames: the closed months' records per dataset."""
+    return {"entries": {}, "lock": threading.Lock()}
+
+def get_monthly_records(df_coffee: pd.DataFrame, df_tea: pd.DataFrame) -> list:
+    """
+    Coffee and Tea monarch (most drinks) of every Madrid calendar month, newest first, from the daily
+    rollups. For the shared frames the records of closed months are kept across dataset versions:
+    while newly synced rows only fall in the current (or a later) month, only those months are recomputed.
+    """
+    parts = [df for df in (df_coffee, df_tea) if not df.empty]
+    if not parts:
+        return []
+    daily = pd.concat([get_daily_rollup(df) for df in parts], axis=1).fillna(0)
+    keys = [registered_key(df) for df in parts]
+    if any(key is None for key in keys) or any("id" not in df.columns for df in parts):
+        return _monthly_records(daily)
+
+    (source, table, (generation, _), columns), _ = keys[0]
+    current = pd.Timestamp.now(tz="Europe/Madrid").tz_localize(None).to_period("M")
+    open_from = current.start_time
+    store = _get_monthly_store()
+    with store["lock"]:
+        entry = store["entries"].setdefault(
+            (source, table, generation, columns, tuple(key[1] for key in keys)),
+            {"month": None, "marks": None, "closed": None, "lock": threading.Lock()}
+        )
+    with entry["lock"]:
+        marks = []
+        for df in parts:
+            n_stored = _stored_rows(df)
+            marks.append((n_stored, df["id"].iloc[n_stored - 1] if n_stored else None))
+        reuse = entry["closed"] is not None and entry["month"] == current
+        if reuse:
+            for df, (n_done, last_id), (n_stored, _) in zip(parts, entry["marks"], marks):
+                # The stored rows grew (or stayed) and none of the new ones predates the current month
+                new_rows = df.iloc[n_done:n_stored]
+                if n_done > n_stored or (n_done and df["id"].iloc[n_done - 1] != last_id) or \
+                        (not new_rows.empty and new_rows["created_at_local"].min().tz_localize(None) < open_from):
+                    reuse = False
+                    break
+        if not reuse:
+            closed = _monthly_records(daily.loc[daily.index < open_from])
+            entry["month"], entry["closed"] = current, closed
+        entry["marks"] = marks
+        closed = entry["closed"]
+    return _monthly_records(daily.loc[daily.index >= open_from]) + closed
+
+def _drink_label(user: str, drink_id: int) -> str:
+    if drink_id in [1, 3]:
+        return f"{user} (coffee)"
+    if drink_id in [2, 4]:
+        return f"{user} (tea)"
+    return user
+
+@st.cache_data(show_spinner=False, hash_funcs=DATASET_HASH_FUNCS)
+def get_cumulative_data(data, start_date, end_date, users, freq="D", label_drinks=False):
+    """
+    Cumulative drinks per user (or per "user (coffee)"/"user (tea)" line with label_drinks) at
+    `freq` between two dates. Slices the daily rollup of `data`, so it costs O(days), not O(events);
+    days are Madrid calendar days, labelled in the timezone of `start_date`.
+    """
     # 1. Normalize dates to clean midnight intervals so reindex matches resampled timestamps
     start_date = pd.to_datetime(start_date).normalize()
     end_date = pd.to_datetime(end_date).normalize()
     full_index = pd.date_range(start=start_date, end=end_date, freq=freq)
     
-    # 2. Filter data within normalized boundaries
-    mask = (data["created_at"] >= start_date) & (data["created_at"] <= (end_date + pd.Timedelta(days=1)))
-    filtered_df = data.loc[mask].copy()
+    # 2. Days within the normalized boundaries, as wall-clock dates
+    start_day = start_date.tz_localize(None) if start_date.tz is not None else start_date
+    end_day = end_date.tz_localize(None) if end_date.tz is not None else end_date
+    daily = get_daily_rollup(data) if not data.empty else pd.DataFrame()
+    if not daily.empty:
+        daily = daily.loc[(daily.index >= start_day) & (daily.index <= end_day + pd.Timedelta(days=1))]
     
-    if filtered_df.empty:
+    if daily.empty:
         empty_df = pd.DataFrame(0, index=full_index, columns=users)
         return empty_df.cumsum()
 
-    # Pivot to [Time, User] = Count
-    pivot = filtered_df.pivot_table(index="created_at", columns="user_name", values="value", aggfunc="sum", fill_value=0)
-    
-    # 3. Ensure all users exist
+    # 3. One column per chart line, then ensure all users exist
+    labels = [_drink_label(u, d) if label_drinks else u for u, d in daily.columns]
+    per_line = daily.T.groupby(labels).sum().T
+    per_line = per_line.loc[:, per_line.sum() > 0]
+    per_line.columns.name = "user_name"
     for u in users:
-        if u not in pivot.columns:
-            pivot[u] = 0
+        if u not in per_line.columns:
+            per_line[u] = 0
             
     # 4. Resample & Reindex
-    resampled = pivot.resample(freq).sum()
-    resampled = resampled.reindex(full_index, fill_value=0)
+    resampled = per_line.resample(freq).sum()
+    resampled = resampled.reindex(pd.date_range(start=start_day, end=end_day, freq=freq), fill_value=0)
+    resampled.index = full_index
     
     # 5. Cumulative Sum
     cumulative = resampled.cumsum()
@@ -100,12 +288,7 @@ def get_cumulative_data(data, start_date, end_date, users, freq="D"):
     return cumulative
 
 def get_expense_and_caffeine(coffee_scores, tea_scores):
-    # Assumptions
-    COFFEE_MG = 95
-    COFFEE_COST = 2.50
-    TEA_MG = 30
-    TEA_COST = 1.50
-    
+    # Assumptions come from the drink catalog (hot and iced versions share them)
     metrics = {}
     for user in set(list(coffee_scores.keys()) + list(tea_scores.keys())):
         coffees = coffee_scores.get(user, 0)
@@ -125,12 +308,12 @@ def get_expense_and_caffeine(coffee_scores, tea_scores):
         
     return metrics
 
-@st.cache_data(show_spinner=False)
+@st.cache_data(show_spinner=False, hash_funcs=DATASET_HASH_FUNCS)
 def get_coin_balances(df, transactions, users):
     balances = {u: 0 for u in users}
     
     if not df.empty:
-        counts = df.groupby("user_name").size()
+        counts = df.groupby("user_name", observed=True).size()
         for u, count in counts.items():
             if u in balances:
                 balances[u] += count * 10
@@ -145,7 +328,33 @@ def get_coin_balances(df, transactions, users):
                     
     return balances
 
-@st.cache_data(show_spinner=False)
+def get_scores_from_totals(click_totals):
+    """Coffee and tea scores per user from pre-aggregated click totals (matches process_raw_data's scores)."""
+    coffee_scores = {}
+    tea_scores = {}
+    for row in click_totals or []:
+        u = row.get("user_name")
+        drink_id = row.get("drink_id") or 1
+        if drink_id in [1, 3]:
+            coffee_scores[u] = coffee_scores.get(u, 0) + int(row.get("value") or 0)
+        elif drink_id in [2, 4]:
+            tea_scores[u] = tea_scores.get(u, 0) + int(row.get("value") or 0)
+    return coffee_scores, tea_scores
+
+def get_coin_balances_from_totals(click_totals, transaction_totals, users):
+    """Coin balances from pre-aggregated click and transaction totals (matches get_coin_balances)."""
+    balances = {u: 0 for u in users}
+    for row in click_totals or []:
+        u = row.get("user_name")
+        if u in balances:
+            balances[u] += int(row.get("clicks") or 0) * 10
+    for row in transaction_totals or []:
+        u = row.get("user_name")
+        if u in balances:
+            balances[u] += int(row.get("amount") or 0)
+    return balances
+
+@st.cache_data(show_spinner=False, hash_funcs=DATASET_HASH_FUNCS)
 def get_active_perks(transactions, users):
     perks = {u: [] for u in users}
     if not transactions:
@@ -177,7 +386,7 @@ ALL_VALID_THEMES = [
     "Velvet Mocha (Cocoa)"
 ]
 
-@st.cache_data(show_spinner=False)
+@st.cache_data(show_spinner=False, hash_funcs=DATASET_HASH_FUNCS)
 def get_unlocked_themes(transactions, user):
     """Returns list of themes unlocked by a specific user (always includes base themes)."""
     unlocked = set(BASE_THEMES)
@@ -200,7 +409,7 @@ def get_unlocked_themes(transactions, user):
     # Return in standardized order
     return [t for t in ALL_VALID_THEMES if t in unlocked]
 
-@st.cache_data(show_spinner=False)
+@st.cache_data(show_spinner=False, hash_funcs=DATASET_HASH_FUNCS)
 def get_user_preferences(transactions=None, users=None, db_preferences=None):
     if db_preferences is None:
         try:
@@ -1,5 +1,18 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 import streamlit as st
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
+from storage import StorageBackend, SupabaseBackend, SQLiteBackend, WriteQueue, ResilientBackend
+
+# Seconds a single Supabase request may take before it counts as failed (the client default is 120)
+CALL_TIMEOUT = 10
 
 # Initialize Supabase Client
 @st.cache_resource
@@ -10,183 +23,860 @@ def get_supabase_client() -> Client:
     except FileNotFoundError:
         st.error("Secrets not found! Please create .streamlit/secrets.toml")
         st.stop()
-    return create_client(url, key)
+    return create_client(url, key, options=ClientOptions(postgrest_client_timeout=CALL_TIMEOUT))
+
+# Local SQLite stand-in used when the storage backend is set to "sqlite"
+_LOCAL_BACKEND_FILE = os.path.join(os.path.dirname(__file__), ".local_backend.sqlite3")
+
+def _get_storage_setting(name: str, default: str = None) -> str:
+    """Reads a [storage] setting from secrets, overridable with a COFFEE_STORAGE_<NAME> env var."""
+    env_val = os.environ.get(f"COFFEE_STORAGE_{name.upper()}")
+    if env_val:
+        return env_val
+    try:
+        return st.secrets["storage"][name]
+    except Exception:
+        return default
+
+@st.cache_resource
+def get_backend() -> StorageBackend:
+    """
+    Returns the process-wide storage backend: Supabase by default, or the in-process SQLite
+    stand-in (same schema) when `[storage] backend = "sqlite"` or COFFEE_STORAGE_BACKEND=sqlite.
+    Every call goes through the shared retry / circuit-breaker policy (storage.ResilientBackend).
+    """
+    if _get_storage_setting("backend", "supabase") == "sqlite":
+        return ResilientBackend(SQLiteBackend(_get_storage_setting("sqlite_path", _LOCAL_BACKEND_FILE)))
+    try:
+        url = st.secrets["supabase"]["url"]
+    except Exception:
+        url = ""
+    return ResilientBackend(SupabaseBackend(get_supabase_client(), url=url))
 
 def clear_all_db_caches():
-    """Explicitly clears all in-memory database query caches."""
+    """Explicitly clears all database query caches and drops the mirrored tables (in memory and on disk), so the next read re-syncs them from scratch."""
+    backend = get_backend()
+    for table in ("clicks", "coin_transactions"):
+        try:
+            mirror = _get_table_mirror(backend.key, table)
+            with mirror["lock"]:
+                # Dropped rather than re-synced on top: rows updated or deleted in the backend would
+                # otherwise survive. Pending (journaled, unflushed) rows are kept.
+                mirror["rows"] = []
+                mirror["seen_ids"] = set()
+                mirror["high_water"] = None
+                mirror["synced_at"] = 0.0
+                mirror["generation"] += 1
+                mirror["version"] += 1
+                if backend.persistent:
+                    _drop_mirror_from_disk(f"{backend.key}/{table}")
+            _get_totals_state(backend.key, table)["rows"] = None
+        except Exception:
+            pass
     try:
-        get_data.clear()
+        _get_snapshot_store(backend.key)["entries"].clear()
     except Exception:
         pass
     try:
-        get_transactions.clear()
+        _preferences_snapshot.clear()
     except Exception:
         pass
+
+# Incremental sync: rows fetched per page and how far behind the high-water mark to re-read
+SYNC_PAGE_SIZE = 1000
+SYNC_LOOKBACK = pd.Timedelta(minutes=5)
+# Concurrent page requests when a sync has to scan more than one page (cold start, long offline gap)
+SYNC_SCAN_WORKERS = 4
+# Seconds a synced mirror (and the aggregated totals) is served before asking the backend again
+SYNC_INTERVAL = 60
+# With the change feed running, the backend is only re-read this often (seconds) to catch missed events
+FEED_RESYNC_INTERVAL = 600
+
+# Local persistent mirror of synced tables (warm start across process restarts)
+_MIRROR_FILE = os.path.join(os.path.dirname(__file__), ".table_mirror.sqlite3")
+# Bumped whenever the layout of the persisted rows changes; tables stamped otherwise are rebuilt
+MIRROR_FORMAT = 1
+
+def _open_mirror_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(_MIRROR_FILE, timeout=5)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS mirror_rows ("
+        "table_name TEXT NOT NULL, row_id TEXT NOT NULL, created_at TEXT, payload TEXT NOT NULL, "
+        "PRIMARY KEY (table_name, row_id))"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS mirror_state (table_name TEXT PRIMARY KEY, high_water TEXT, stamp TEXT)")
+    if "stamp" not in {r[1] for r in conn.execute("PRAGMA table_info(mirror_state)").fetchall()}:
+        # Files written before the stamp existed: their tables read as unstamped and are rebuilt
+        conn.execute("ALTER TABLE mirror_state ADD COLUMN stamp TEXT")
+    return conn
+
+def _load_mirror_from_disk(table: str, stamp: str | None) -> tuple[list, pd.Timestamp | None]:
+    """
+    Returns the rows and high-water mark persisted for a table, or nothing if the file is unusable.
+    A table persisted under another stamp (format or column projection) is dropped so it re-syncs
+    from scratch; with no stamp to compare (`stamp` None) the persisted rows are trusted.
+    """
     try:
-        get_preferences.clear()
+        conn = _open_mirror_db()
+        try:
+            state = conn.execute("SELECT high_water, stamp FROM mirror_state WHERE table_name = ?", (table,)).fetchone()
+            if stamp is not None and (state is None or state[1] != stamp):
+                with conn:
+                    conn.execute("DELETE FROM mirror_rows WHERE table_name = ?", (table,))
+                    conn.execute("DELETE FROM mirror_state WHERE table_name = ?", (table,))
+                return [], None
+            cur = conn.execute("SELECT payload FROM mirror_rows WHERE table_name = ? ORDER BY created_at, row_id", (table,))
+            rows = [json.loads(payload) for (payload,) in cur.fetchall()]
+        finally:
+            conn.close()
+        high_water = pd.Timestamp(state[0]) if state and state[0] else None
+        return rows, high_water
+    except Exception:
+        return [], None
+
+def _drop_mirror_from_disk(table: str) -> None:
+    """Deletes a table's persisted rows and high-water mark, so the next process starts it cold."""
+    try:
+        conn = _open_mirror_db()
+        try:
+            with conn:
+                conn.execute("DELETE FROM mirror_rows WHERE table_name = ?", (table,))
+                conn.execute("DELETE FROM mirror_state WHERE table_name = ?", (table,))
+        finally:
+            conn.close()
     except Exception:
         pass
 
-@st.cache_data(ttl=60, show_spinner=False)
-def get_data():
-    supabase = get_supabase_client()
-    try:
-        all_data = []
-        limit = 1000
-        offset = 0
-        while True:
-            response = supabase.table("clicks").select("*").range(offset, offset + limit - 1).execute()
-            data = response.data
-            if not data:
-                break
-            all_data.extend(data)
-            if len(data) < limit:
-                break
-            offset += limit
-        return all_data
+def _save_mirror_to_disk(table: str, new_rows: list, high_water, stamp: str | None) -> None:
+    """Appends freshly synced rows to the persistent mirror and records the new high-water mark and stamp."""
+    try:
+        conn = _open_mirror_db()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO mirror_rows (table_name, row_id, created_at, payload) VALUES (?, ?, ?, ?)",
+                    [(table, str(r.get("id")), r.get("created_at"), json.dumps(r, ensure_ascii=False)) for r in new_rows]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO mirror_state (table_name, high_water, stamp) VALUES (?, ?, ?)",
+                    (table, high_water.isoformat() if high_water is not None else None, stamp)
+                )
+        finally:
+            conn.close()
     except Exception:
-        return []
+        pass
 
-def insert_click(user: str, value: int, drink_id: int, country: str = None, city: str = None):
-    supabase = get_supabase_client()
-    result = None
-    
-    # 1. Preferred modern format: single JSON column "location" (e.g. {"country": "ES", "city": "Alcobendas"})
-    if country or city:
-        loc_json = {}
-        if country: loc_json["country"] = country
-        if city: loc_json["city"] = city
-        
-        # Try inserting with single JSON column 'location'
+@st.cache_resource
+def _get_table_mirror(source: str, table: str) -> dict:
+    """Process-wide materialized copy of a backend table, warm-started from disk and grown past its created_at high-water mark."""
+    rows, high_water = _load_mirror_from_disk(f"{source}/{table}", _mirror_stamp(table)) if get_backend().persistent else ([], None)
+    return {
+        "rows": rows,
+        "seen_ids": {r.get("id") for r in rows},
+        "high_water": high_water,
+        "version": 0,
+        # Bumped when the rows are dropped and re-synced from scratch (clear_all_db_caches)
+        "generation": 0,
+        "synced_at": 0.0,
+        # Rows queued in the write-ahead journal but not flushed yet, by journal entry id
+        "pending": {},
+        "lock": threading.Lock()
+    }
+
+# Columns the app reads from each synced table (None: all of them); the mirror only fetches these
+MIRROR_COLUMNS = {
+    "clicks": ["id", "created_at", "user_name", "value", "drink_id"],
+    "coin_transactions": None
+}
+
+def _mirror_columns(table: str, backend: StorageBackend = None):
+    """Projection synced for a table; clicks add whichever location columns the table has."""
+    columns = MIRROR_COLUMNS.get(table)
+    if table == "clicks":
+        backend = backend or get_backend()
         try:
-            event_data_json = {
-                "user_name": user,
-                "value": value,
-                "drink_id": drink_id,
-                "location": loc_json
-            }
-            result = supabase.table("clicks").insert(event_data_json).execute()
+            columns = columns + get_clicks_location_columns(backend.key, backend)
         except Exception:
-            pass
-            
-        # Try inserting with separate columns 'country' and 'city'
-        if result is None:
+            return None
+    return columns
+
+def _mirror_stamp(table: str, backend: StorageBackend = None) -> str | None:
+    """What a table's rows are persisted as (file format and column projection); None while the clicks location probe fails."""
+    columns = _mirror_columns(table, backend)
+    if table == "clicks" and columns is None:
+        return None
+    return json.dumps({"format": MIRROR_FORMAT, "columns": columns})
+
+def _fetch_rows_since(table: str, since) -> list:
+    """
+    Pages through rows created at or after `since` (everything when None) in created_at order.
+    A sync that does not fit in one page counts the remaining rows and pulls the other pages
+    concurrently, then keeps paging sequentially past anything inserted after the count.
+    """
+    backend = get_backend()
+    columns = _mirror_columns(table)
+    rows = backend.fetch_rows(table, since=since, offset=0, limit=SYNC_PAGE_SIZE, columns=columns)
+    if len(rows) < SYNC_PAGE_SIZE:
+        return rows
+    try:
+        total = backend.count_rows(table, since=since)
+    except Exception:
+        total = 0
+    offsets = list(range(SYNC_PAGE_SIZE, total, SYNC_PAGE_SIZE))
+    last_page = rows
+    if offsets:
+        with ThreadPoolExecutor(max_workers=min(SYNC_SCAN_WORKERS, len(offsets))) as pool:
+            # map() yields pages in offset order, so the scan reassembles exactly as a sequential one
+            for page in pool.map(lambda off: backend.fetch_rows(table, since=since, offset=off, limit=SYNC_PAGE_SIZE, columns=columns), offsets):
+                rows.extend(page)
+                last_page = page
+    offset = SYNC_PAGE_SIZE * (len(offsets) + 1)
+    while len(last_page) == SYNC_PAGE_SIZE:
+        last_page = backend.fetch_rows(table, since=since, offset=offset, limit=SYNC_PAGE_SIZE, columns=columns)
+        rows.extend(last_page)
+        offset += SYNC_PAGE_SIZE
+    return rows
+
+def _sync_mirror(table: str, mirror: dict) -> None:
+    """Fetches rows past the mirror's high-water mark and appends the unseen ones (caller holds the lock)."""
+    since = mirror["high_water"] - SYNC_LOOKBACK if mirror["high_water"] is not None else None
+    fetched = _fetch_rows_since(table, since)
+    new_rows = []
+    for row in fetched:
+        if row.get("id") not in mirror["seen_ids"]:
+            mirror["seen_ids"].add(row.get("id"))
+            new_rows.append(row)
+    mirror["rows"].extend(new_rows)
+    # Rows arrive in created_at order, so the last one carries the new high-water mark
+    if fetched:
+        latest = pd.to_datetime(fetched[-1].get("created_at"), utc=True, errors="coerce")
+        if pd.notna(latest):
+            mirror["high_water"] = latest
+    if new_rows:
+        mirror["version"] += 1
+        if get_backend().persistent:
+            _save_mirror_to_disk(f"{get_backend().key}/{table}", new_rows, mirror["high_water"], _mirror_stamp(table))
+    mirror["synced_at"] = time.monotonic()
+
+def refresh_table(table: str) -> int:
+    """
+    Syncs the mirror when its last sync is older than SYNC_INTERVAL and returns its current version.
+    With the change feed running, new rows are pushed into the mirror as they happen, so the
+    backend is only re-read every FEED_RESYNC_INTERVAL as a safety net for missed events.
+    """
+    backend = get_backend()
+    feed = _get_change_feed(backend.key)
+    interval = FEED_RESYNC_INTERVAL if feed["active"] else SYNC_INTERVAL
+    try:
+        # Resumes flushing taps a previous process journaled but never wrote
+        _get_write_queue(backend.key)
+    except Exception:
+        pass
+    mirror = _get_table_mirror(backend.key, table)
+    with mirror["lock"]:
+        if time.monotonic() - mirror["synced_at"] >= interval:
             try:
-                event_data_cols = {
-                    "user_name": user,
-                    "value": value,
-                    "drink_id": drink_id,
-                    "country": country,
-                    "city": city
-                }
-                result = supabase.table("clicks").insert(event_data_cols).execute()
+                _sync_mirror(table, mirror)
             except Exception:
+                # Backend down or circuit open: keep serving the last-known-good rows and retry on the next read
                 pass
+        return mirror["version"]
 
-    # 3. Base fallback without location columns
-    if result is None:
-        fallback_data = {
-            "user_name": user,
-            "value": value,
-            "drink_id": drink_id
-        }
-        result = supabase.table("clicks").insert(fallback_data).execute()
+class FrozenRows(list):
+    """
+    Read-only list of row dicts shared by every session reading the same table version.
+    Mutating it raises TypeError; `rows + more`, slicing and list(rows) give ordinary lists.
+    `version` identifies the snapshot: (source, table, mirror version, projection).
+    """
+    version = None
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Shared dataset rows are read-only; copy them with list(rows) first")
+
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+    def __reduce__(self):
+        # Pickles (st.cache_data values, session state) as a plain list
+        return (list, (list(self),))
+
+# Snapshots kept per backend (the live version of each table/projection plus a few older ones)
+SNAPSHOT_STORE_SIZE = 8
+
+@st.cache_resource
+def _get_snapshot_store(source: str) -> dict:
+    """Process-wide store of FrozenRows snapshots, built once per table version and projection."""
+    return {"entries": OrderedDict(), "lock": threading.Lock()}
+
+def _table_snapshot(source: str, table: str, columns: tuple = None) -> FrozenRows:
+    """
+    Shared read-only view of a mirror's rows (plus pending journaled ones) restricted to `columns`.
+    Every session reading the same version gets the same object: no per-session copy or pickle.
+    """
+    mirror = _get_table_mirror(source, table)
+    store = _get_snapshot_store(source)
+    with mirror["lock"]:
+        # Incremental consumers key on the generation: after a rebuild the same ids may carry other values
+        key = (source, table, (mirror["generation"], mirror["version"]), columns)
+        with store["lock"]:
+            if key in store["entries"]:
+                store["entries"].move_to_end(key)
+                return store["entries"][key]
+        rows = list(mirror["rows"]) + [r for queued in mirror["pending"].values() for r in queued]
+    if columns:
+        rows = [{c: r[c] for c in columns if c in r} for r in rows]
+    snapshot = FrozenRows(rows)
+    snapshot.version = key
+    with store["lock"]:
+        snapshot = store["entries"].setdefault(key, snapshot)
+        store["entries"].move_to_end(key)
+        while len(store["entries"]) > SNAPSHOT_STORE_SIZE:
+            store["entries"].popitem(last=False)
+    return snapshot
+
+def _patch_mirror(backend: StorageBackend, table: str, mirror: dict, totals: dict, rows: list,
+                  settles: int = None) -> None:
+    """
+    Appends rows not seen yet to a mirror (new version) and to its aggregated totals.
+    `settles` names the journal entry these rows were queued as: its pending rows are swapped
+    for the stored ones in the same step, and the totals (which already count them) are left alone.
+    """
+    with mirror["lock"]:
+        if settles is not None and mirror["pending"].pop(settles, None) is not None:
+            mirror["version"] += 1
+            totals = None
+        if any(row.get("id") is None for row in rows or []):
+            # The backend did not echo the written rows back: re-sync on the next read instead
+            mirror["synced_at"] = 0.0
+            if totals is not None:
+                totals["rows"] = None
+            return
+        new_rows = []
+        for row in rows or []:
+            if row.get("id") not in mirror["seen_ids"]:
+                mirror["seen_ids"].add(row.get("id"))
+                new_rows.append(row)
+        if not new_rows:
+            return
+        mirror["rows"].extend(new_rows)
+        mirror["version"] += 1
+        if backend.persistent:
+            _save_mirror_to_disk(f"{backend.key}/{table}", new_rows, mirror["high_water"], _mirror_stamp(table, backend))
+    if totals is not None:
+        with totals["lock"]:
+            _patch_totals(totals, table, new_rows)
+
+def _apply_written_rows(table: str, rows: list) -> None:
+    """
+    Patches rows the backend just returned from a write into the table mirror (new version, no re-fetch)
+    and into the aggregated totals, so readers see the write without a sync round trip.
+    The high-water mark is left alone: rows committed by other writers meanwhile are still picked up by the next sync.
+    """
+    backend = get_backend()
+    _patch_mirror(backend, table, _get_table_mirror(backend.key, table), _get_totals_state(backend.key, table), rows)
+
+@st.cache_resource
+def _get_change_feed(source: str) -> dict:
+    """
+    Starts the backend change feed once per process when `[storage] change_feed = true`
+    (or COFFEE_STORAGE_CHANGE_FEED=true). Pushed clicks and transactions are patched into the
+    mirrors like local writes; preference changes bump `preferences_version`.
+    Returns the feed state; `active` stays False when disabled or when the backend cannot watch.
+    """
+    state = {"active": False, "preferences_version": 0}
+    if str(_get_storage_setting("change_feed", "false")).lower() not in ("1", "true", "yes", "on"):
+        return state
+    backend = get_backend()
+    # Resolved up front: the callback runs on the feed's own thread, outside any script run
+    mirrors = {t: _get_table_mirror(source, t) for t in ("clicks", "coin_transactions")}
+    totals = {t: _get_totals_state(source, t) for t in mirrors}
+
+    def on_change(table: str, rows: list):
+        if table in mirrors:
+            _patch_mirror(backend, table, mirrors[table], totals[table], rows)
+        elif table == "user_preferences":
+            state["preferences_version"] += 1
 
-    # Clear cached query data so fresh clicks appear immediately
     try:
-        get_data.clear()
+        backend.watch(list(mirrors) + ["user_preferences"], on_change)
+        state["active"] = True
     except Exception:
         pass
+    return state
 
+def get_data(columns: list = None):
+    """Click rows as a shared read-only FrozenRows snapshot (optionally only `columns`)."""
+    try:
+        refresh_table("clicks")
+        return _table_snapshot(get_backend().key, "clicks", tuple(columns) if columns else None)
+    except Exception:
+        return []
+
+def _aggregate_rows(rows: list, keys: list, count_col: str, sum_src: str, sum_col: str) -> list:
+    """Pandas fallback for backend aggregations: row count and column sum per group."""
+    if not rows:
+        return []
+    df = pd.DataFrame(rows)
+    for key in keys:
+        if key not in df.columns:
+            df[key] = None
+    if sum_src not in df.columns:
+        df[sum_src] = 0
+    if "drink_id" in keys:
+        df["drink_id"] = df["drink_id"].fillna(1).astype(int)
+    grouped = df.groupby(keys, dropna=False).agg(**{count_col: (sum_src, "size"), sum_col: (sum_src, "sum")})
+    return grouped.reset_index().to_dict("records")
+
+# Group keys and counters of the aggregated totals, per table
+_TOTALS_SPEC = {
+    "clicks": (("user_name", "drink_id"), "clicks", "value"),
+    "coin_transactions": (("user_name", "transaction_type"), "transactions", "amount")
+}
+
+@st.cache_resource
+def _get_totals_state(source: str, table: str) -> dict:
+    """Process-wide aggregated totals of a table, refreshed every SYNC_INTERVAL and patched in place by writes."""
+    return {"rows": None, "fetched_at": 0.0, "lock": threading.Lock()}
+
+def _read_totals(table: str, fetch) -> list:
+    backend = get_backend()
+    interval = FEED_RESYNC_INTERVAL if _get_change_feed(backend.key)["active"] else SYNC_INTERVAL
+    state = _get_totals_state(backend.key, table)
+    mirror = _get_table_mirror(backend.key, table)
+    with state["lock"]:
+        if state["rows"] is None or time.monotonic() - state["fetched_at"] >= interval:
+            try:
+                fetched = fetch()
+            except Exception:
+                # Serve the last-known-good totals; with none yet, fail without caching anything
+                if state["rows"] is None:
+                    raise
+                return [dict(r) for r in state["rows"]]
+            state["rows"] = [dict(r) for r in fetched]
+            state["fetched_at"] = time.monotonic()
+            # Rows still waiting in the write-ahead journal count as written
+            with mirror["lock"]:
+                queued = [r for rows in mirror["pending"].values() for r in rows]
+            _patch_totals(state, table, queued)
+        return [dict(r) for r in state["rows"]]
+
+def _patch_totals(state: dict, table: str, rows: list) -> None:
+    """
+    Adds freshly written rows to the cached totals of their group (no-op until the totals were first read).
+    Callers hold state["lock"].
+    """
+    if table not in _TOTALS_SPEC or state["rows"] is None:
+        return
+    keys, count_col, sum_col = _TOTALS_SPEC[table]
+    groups = {tuple(r.get(k) for k in keys): r for r in state["rows"]}
+    for row in rows:
+        group = tuple((row.get(k) or 1) if k == "drink_id" else row.get(k) for k in keys)
+        if group not in groups:
+            groups[group] = {**dict(zip(keys, group)), count_col: 0, sum_col: 0}
+            state["rows"].append(groups[group])
+        groups[group][count_col] = int(groups[group].get(count_col) or 0) + 1
+        groups[group][sum_col] = int(groups[group].get(sum_col) or 0) + int(row.get(sum_col) or 0)
+
+def _fetch_click_totals() -> list:
+    try:
+        return get_backend().aggregate_clicks()
+    except Exception:
+        return _aggregate_rows(get_data(["user_name", "drink_id", "value"]), ["user_name", "drink_id"], "clicks", "value", "value")
+
+def get_click_totals():
+    """Per-user, per-drink_id click counts and value sums, aggregated by the backend when it supports it."""
+    try:
+        return _read_totals("clicks", _fetch_click_totals)
+    except Exception:
+        return []
+
+def _click_row(user: str, value: int, drink_id: int, country: str = None, city: str = None) -> dict:
+    return {"user_name": user, "value": value, "drink_id": drink_id, "country": country, "city": city}
+
+@st.cache_resource
+def get_clicks_location_columns(source: str, _backend: StorageBackend = None) -> list:
+    """
+    Location columns present on the clicks table, probed once per process (legacy rows may use either).
+    Transient probe errors propagate so that no answer gets cached for them. `_backend` (left out of
+    the cache key) probes through an already resolved backend, e.g. from the write-queue flusher.
+    """
+    backend = _backend or get_backend()
+    columns = []
+    if backend.has_columns("clicks", ["location"]):
+        columns.append("location")
+    if backend.has_columns("clicks", ["country", "city"]):
+        columns.extend(["country", "city"])
+    return columns
+
+def get_clicks_location_shape(source: str, backend: StorageBackend = None) -> str:
+    """
+    How new clicks store their location, from the probed columns: "json" (single JSONB `location`
+    column, preferred), "columns" (`country`/`city`) or "none".
+    """
+    columns = get_clicks_location_columns(source, backend)
+    if "location" in columns:
+        return "json"
+    if "country" in columns:
+        return "columns"
+    return "none"
+
+def _insert_click_rows(clicks: list, backend: StorageBackend = None, shape: str = None) -> list:
+    """Bulk-inserts click rows built by _click_row in the location shape the clicks table supports."""
+    backend = backend or get_backend()
+    if shape is None:
+        try:
+            shape = get_clicks_location_shape(backend.key, backend)
+        except Exception:
+            # Probe failed transiently (nothing cached): write the modern shape and probe again next time
+            shape = "json"
+    rows = []
+    for c in clicks:
+        row = {"user_name": c["user_name"], "value": c["value"], "drink_id": c["drink_id"]}
+        if c.get("created_at"):
+            # Journaled taps keep the time they were logged, unless flushed late (see _stamp_for_flush)
+            row["created_at"] = c["created_at"]
+        if shape == "json":
+            # Preferred modern format: single JSON column "location" (e.g. {"country": "ES", "city": "Alcobendas"})
+            row["location"] = {k: c[k] for k in ("country", "city") if c.get(k)} or None
+        elif shape == "columns":
+            row["country"] = c.get("country")
+            row["city"] = c.get("city")
+        rows.append(row)
+    return backend.insert_rows("clicks", rows)
+
+def insert_click(user: str, value: int, drink_id: int, country: str = None, city: str = None):
+    result = _insert_click_rows([_click_row(user, value, drink_id, country, city)])
+
+    # Patch the written row into the cached clicks so it appears immediately (transactions stay cached)
+    _apply_written_rows("clicks", result)
     return result
 
-@st.cache_data(ttl=60, show_spinner=False)
-def get_transactions():
-    supabase = get_supabase_client()
-    try:
-        all_data = []
-        limit = 1000
-        offset = 0
-        while True:
-            response = supabase.table("coin_transactions").select("*").range(offset, offset + limit - 1).execute()
-            data = response.data
-            if not data:
-                break
-            all_data.extend(data)
-            if len(data) < limit:
-                break
-            offset += limit
-        return all_data
+def get_transactions(columns: list = None):
+    """Coin transaction rows as a shared read-only FrozenRows snapshot (optionally only `columns`)."""
+    try:
+        refresh_table("coin_transactions")
+        return _table_snapshot(get_backend().key, "coin_transactions", tuple(columns) if columns else None)
+    except Exception:
+        return []
+
+def _fetch_transaction_totals() -> list:
+    try:
+        return get_backend().aggregate_transactions()
+    except Exception:
+        return _aggregate_rows(get_transactions(["user_name", "transaction_type", "amount"]), ["user_name", "transaction_type"], "transactions", "amount", "amount")
+
+def get_transaction_totals():
+    """Per-user, per-transaction_type row counts and amount sums, aggregated by the backend when it supports it."""
+    try:
+        return _read_totals("coin_transactions", _fetch_transaction_totals)
     except Exception:
         return []
 
 def insert_transaction(user: str, amount: int, transaction_type: str, metadata: dict = None):
     if metadata is None:
         metadata = {}
-    supabase = get_supabase_client()
+    backend = get_backend()
     event_data = {
         "user_name": user,
         "amount": amount,
         "transaction_type": transaction_type,
         "metadata": metadata
     }
-    result = supabase.table("coin_transactions").insert(event_data).execute()
-    try:
-        get_transactions.clear()
-    except Exception:
-        pass
+    result = backend.insert_rows("coin_transactions", [event_data])
+    _apply_written_rows("coin_transactions", result)
     return result
 
-@st.cache_data(ttl=60, show_spinner=False)
+@st.cache_data(max_entries=4, show_spinner=False)
+def _preferences_snapshot(source: str, version: tuple) -> list:
+    # Errors propagate so that a failed read is never cached
+    return get_backend().select_where("user_preferences", {})
+
+@st.cache_resource
+def _get_last_good_preferences(source: str) -> dict:
+    return {"rows": []}
+
 def get_preferences():
-    """Fetches all rows from the dedicated user_preferences table."""
-    supabase = get_supabase_client()
+    """Fetches all rows from the dedicated user_preferences table (re-read on changes, or every SYNC_INTERVAL without the change feed)."""
+    backend = get_backend()
+    feed = _get_change_feed(backend.key)
+    polling_slot = 0 if feed["active"] else int(time.monotonic() // SYNC_INTERVAL)
+    last_good = _get_last_good_preferences(backend.key)
     try:
-        response = supabase.table("user_preferences").select("*").execute()
-        return response.data or []
+        last_good["rows"] = _preferences_snapshot(backend.key, (feed["preferences_version"], polling_slot))
     except Exception:
-        return []
+        pass
+    return list(last_good["rows"])
 
-def save_user_preference(user_name: str, updates: dict):
-    """Saves or updates user settings in user_preferences table with seamless fallback."""
-    supabase = get_supabase_client()
-    try:
-        existing = supabase.table("user_preferences").select("*").eq("user_name", user_name).execute()
-        known_columns = {"theme", "emoji", "title", "ui_style", "default_country", "default_city", "share_live_location"}
-        col_updates = {}
-        meta_updates = {}
-        for k, v in updates.items():
-            if k in known_columns:
-                col_updates[k] = v
-            else:
-                meta_updates[k] = v
-
-        if existing.data and len(existing.data) > 0:
-            row = existing.data[0]
-            cur_meta = row.get("metadata") if isinstance(row.get("metadata"), dict) else {}
-            if meta_updates:
-                cur_meta.update(meta_updates)
-                col_updates["metadata"] = cur_meta
-            res = supabase.table("user_preferences").update(col_updates).eq("user_name", user_name).execute()
+# Settings stored in their own user_preferences columns; any other key goes into metadata
+PREFERENCE_COLUMNS = {"theme", "emoji", "title", "ui_style", "default_country", "default_city", "share_live_location"}
+
+def _preference_record(user_name: str, updates: dict) -> dict:
+    """Splits one user's updates into column values and a metadata patch."""
+    record = {"user_name": user_name, "metadata": {}}
+    for k, v in updates.items():
+        if k in PREFERENCE_COLUMNS:
+            record[k] = v
         else:
-            record = {"user_name": user_name, **col_updates}
-            if meta_updates:
-                record["metadata"] = meta_updates
-            res = supabase.table("user_preferences").insert(record).execute()
+            record["metadata"][k] = v
+    return record
 
-        try:
-            get_preferences.clear()
-            get_transactions.clear()
-        except Exception:
-            pass
+def _write_user_preference(backend: StorageBackend, user_name: str, updates: dict):
+    """Read-merge-write path for backends without the upsert (two round trips, last writer wins on metadata)."""
+    existing = backend.select_where("user_preferences", {"user_name": user_name})
+    record = _preference_record(user_name, updates)
+    meta_updates = record.pop("metadata")
+    col_updates = {k: v for k, v in record.items() if k != "user_name"}
+
+    if existing:
+        row = existing[0]
+        cur_meta = row.get("metadata") if isinstance(row.get("metadata"), dict) else {}
+        if meta_updates:
+            cur_meta.update(meta_updates)
+            col_updates["metadata"] = cur_meta
+        res = backend.update_rows("user_preferences", col_updates, {"user_name": user_name})
+    else:
+        record = {"user_name": user_name, **col_updates}
+        if meta_updates:
+            record["metadata"] = meta_updates
+        res = backend.insert_rows("user_preferences", [record])
+    return res
+
+def _write_user_preferences(backend: StorageBackend, updates_by_user: dict) -> list:
+    """
+    Saves several users' settings with one atomic upsert round trip (metadata merged server-side),
+    falling back to the read-merge-write path per user when the backend lacks the upsert.
+    """
+    records = [_preference_record(user, updates) for user, updates in updates_by_user.items()]
+    try:
+        return backend.upsert_preferences(records)
+    except Exception:
+        res = []
+        for user, updates in updates_by_user.items():
+            res.extend(_write_user_preference(backend, user, updates))
+        return res
+
+def save_user_preferences(updates_by_user: dict) -> list:
+    """Bulk variant of save_user_preference: {user_name: updates} saved in a single round trip."""
+    if not updates_by_user:
+        return []
+    backend = get_backend()
+    try:
+        res = _write_user_preferences(backend, updates_by_user)
+        # Only the preferences cache depends on this table
+        _get_change_feed(backend.key)["preferences_version"] += 1
         return res
     except Exception:
         # Fallback to coin_transactions if user_preferences table is not created yet
-        res = insert_transaction(user_name, 0, "preference", updates)
-        try:
-            get_preferences.clear()
-            get_transactions.clear()
-        except Exception:
-            pass
+        rows = [
+            {"user_name": user, "amount": 0, "transaction_type": "preference", "metadata": updates}
+            for user, updates in updates_by_user.items()
+        ]
+        res = backend.insert_rows("coin_transactions", rows)
+        _apply_written_rows("coin_transactions", res)
         return res
 
+def save_user_preference(user_name: str, updates: dict):
+    """Saves or updates user settings in user_preferences table with seamless fallback."""
+    return save_user_preferences({user_name: updates})
+
+# Durable write-ahead journals for deferred WriteBatch commits (see WriteBatch.commit), one per backend
+def _write_queue_file(source: str) -> str:
+    """Journal file of a backend: entries are only ever replayed against the backend that queued them."""
+    return os.path.join(os.path.dirname(__file__), f".write_queue.{hashlib.sha1(source.encode()).hexdigest()[:12]}.sqlite3")
+
+# Oldest tap time a journaled row may be stored with: other processes sync past a created_at
+# high-water mark minus SYNC_LOOKBACK, so a row stored further back could never reach them
+JOURNAL_BACKDATE_LIMIT = SYNC_LOOKBACK / 2
+
+def _stamp_for_flush(rows: list) -> list:
+    """
+    Journaled rows as they are written: taps flushed late get the backend's insert time instead of
+    their tap time. Transactions keep the tap time as `tapped_at` in their metadata (clicks have no
+    column for it).
+    """
+    cutoff = pd.Timestamp.now(tz="UTC") - JOURNAL_BACKDATE_LIMIT
+    stamped = []
+    for row in rows:
+        created = pd.to_datetime(row.get("created_at"), utc=True, errors="coerce")
+        if pd.isna(created) or created < cutoff:
+            tapped_at = row.get("created_at")
+            row = {k: v for k, v in row.items() if k != "created_at"}
+            if tapped_at and "metadata" in row:
+                row["metadata"] = {**(row["metadata"] or {}), "tapped_at": tapped_at}
+        stamped.append(row)
+    return stamped
+
+@st.cache_resource
+def _get_write_queue(source: str) -> WriteQueue:
+    """
+    Starts the process-wide write-ahead queue for a backend. Entries journaled by an earlier
+    process that never reached the backend are shown as pending again and flushed first.
+    The flusher runs on its own thread, so the backend, mirrors and totals it touches are resolved
+    here; only the clicks location shape is probed (through that backend) when a flush needs it.
+    """
+    backend = get_backend()
+    mirrors = {t: _get_table_mirror(source, t) for t in ("clicks", "coin_transactions")}
+    totals = {t: _get_totals_state(source, t) for t in mirrors}
+    feed = _get_change_feed(source)
+
+    def flush(entry_id: int, payload: dict, checkpoint):
+        # One step per table; each finished step is checkpointed so a retry only redoes what failed
+        if payload.get("clicks"):
+            # Probed per flush until it succeeds (then cached): a failed probe backs the entry off
+            # instead of guessing a location shape the table may not have
+            shape = get_clicks_location_shape(source, backend)
+            stored = _insert_click_rows(_stamp_for_flush(payload["clicks"]), backend=backend, shape=shape)
+            _patch_mirror(backend, "clicks", mirrors["clicks"], totals["clicks"], stored, settles=entry_id)
+            payload["clicks"] = []
+            checkpoint(payload)
+        if payload.get("coin_transactions"):
+            stored = backend.insert_rows("coin_transactions", _stamp_for_flush(payload["coin_transactions"]))
+            _patch_mirror(backend, "coin_transactions", mirrors["coin_transactions"], totals["coin_transactions"], stored, settles=entry_id)
+            payload["coin_transactions"] = []
+            checkpoint(payload)
+        if payload.get("preferences"):
+            try:
+                _write_user_preferences(backend, payload["preferences"])
+                feed["preferences_version"] += 1
+            except Exception:
+                # Same legacy fallback as save_user_preferences
+                rows = [
+                    {"user_name": user, "amount": 0, "transaction_type": "preference", "metadata": updates}
+                    for user, updates in payload["preferences"].items()
+                ]
+                stored = backend.insert_rows("coin_transactions", rows)
+                _patch_mirror(backend, "coin_transactions", mirrors["coin_transactions"], totals["coin_transactions"], stored)
+            payload["preferences"] = {}
+            checkpoint(payload)
+
+    def on_dead(entry_id: int, payload: dict, error: Exception):
+        # The entry will not be written: withdraw its pending rows and re-read the totals that counted them
+        for table, mirror in mirrors.items():
+            with mirror["lock"]:
+                withdrawn = mirror["pending"].pop(entry_id, None) is not None
+                if withdrawn:
+                    mirror["version"] += 1
+            if withdrawn:
+                with totals[table]["lock"]:
+                    totals[table]["rows"] = None
+
+    queue = WriteQueue(_write_queue_file(source) if backend.persistent else ":memory:", flush, on_dead=on_dead)
+    for entry_id, payload in queue.pending():
+        _queue_pending_rows(mirrors, totals, entry_id, payload)
+    queue.start()
+    return queue
+
+def get_write_queue_status(user: str = None) -> dict:
+    """
+    Health of the write-ahead journal (WriteQueue.stats()) plus `failed`: the entries set aside after
+    failing for good, with what was left to write (only those touching `user` when given).
+    """
+    try:
+        queue = _get_write_queue(get_backend().key)
+    except Exception:
+        return {"pending": 0, "dead": 0, "max_attempts": 0, "last_error": None, "failed": []}
+    failed = queue.dead_letters()
+    if user is not None:
+        failed = [
+            entry for entry in failed
+            if user in entry["payload"].get("preferences", {})
+            or any(r.get("user_name") == user for t in ("clicks", "coin_transactions") for r in entry["payload"].get(t, []))
+        ]
+    return {**queue.stats(), "failed": failed}
+
+def _queue_pending_rows(mirrors: dict, totals: dict, entry_id: int, payload: dict) -> None:
+    """Shows a journaled entry's rows in the mirrors and totals until the flusher stores them."""
+    for table, mirror in mirrors.items():
+        rows = [_pending_row(table, r) for r in payload.get(table, [])]
+        if not rows:
+            continue
+        with mirror["lock"]:
+            mirror["pending"][entry_id] = rows
+            mirror["version"] += 1
+        with totals[table]["lock"]:
+            _patch_totals(totals[table], table, rows)
+
+def _pending_row(table: str, row: dict) -> dict:
+    """How a queued row reads back once stored (clicks carry their location as JSON)."""
+    if table != "clicks":
+        return dict(row)
+    pending = {k: v for k, v in row.items() if k not in ("country", "city")}
+    loc_json = {k: row[k] for k in ("country", "city") if row.get(k)}
+    if loc_json:
+        pending["location"] = loc_json
+    return pending
+
+class WriteBatch:
+    """
+    Unit of work for a user action: collects clicks, coin transactions and preference updates,
+    then sends one bulk insert per table on commit() instead of one round trip per row.
+    pending_rows() exposes the queued rows (stamped with the local time) so callers can
+    evaluate their effect before anything is written. commit(defer=True) journals the batch
+    and returns without waiting for the backend.
+    """
+
+    def __init__(self):
+        self.clicks = []
+        self.transactions = []
+        self.preferences = {}
+        self._pending = {"clicks": [], "coin_transactions": []}
+
+    def add_click(self, user: str, value: int, drink_id: int, country: str = None, city: str = None):
+        click = _click_row(user, value, drink_id, country, city)
+        self.clicks.append(click)
+        self._pending["clicks"].append({**_pending_row("clicks", click), "created_at": pd.Timestamp.now(tz="UTC").isoformat()})
+
+    def add_transaction(self, user: str, amount: int, transaction_type: str, metadata: dict = None):
+        tx = {
+            "user_name": user,
+            "amount": amount,
+            "transaction_type": transaction_type,
+            "metadata": metadata if metadata is not None else {}
+        }
+        self.transactions.append(tx)
+        self._pending["coin_transactions"].append({**tx, "created_at": pd.Timestamp.now(tz="UTC").isoformat()})
+
+    def add_preference(self, user: str, updates: dict):
+        self.preferences.setdefault(user, {}).update(updates)
+
+    def pending_rows(self, table: str) -> list:
+        return list(self._pending.get(table, []))
+
+    def commit(self, defer: bool = False) -> dict:
+        """
+        Writes everything queued (clicks, then transactions, then preferences) and patches the written rows into the caches.
+        With defer=True the batch goes to the durable write-ahead queue instead: it shows up in reads
+        right away as pending rows (keeping their tap time) and a background flusher writes it
+        with retry and backoff, so a slow or unreachable backend neither blocks nor loses the tap.
+        Rows that only reach the backend after JOURNAL_BACKDATE_LIMIT are stored at their insert time.
+        """
+        if defer:
+            return self._enqueue()
+        results = {}
+        if self.clicks:
+            results["clicks"] = _insert_click_rows(self.clicks)
+            _apply_written_rows("clicks", results["clicks"])
+        if self.transactions:
+            results["coin_transactions"] = get_backend().insert_rows("coin_transactions", self.transactions)
+            _apply_written_rows("coin_transactions", results["coin_transactions"])
+        if self.preferences:
+            results["user_preferences"] = save_user_preferences(self.preferences)
+        self.clicks, self.transactions, self.preferences = [], [], {}
+        self._pending = {"clicks": [], "coin_transactions": []}
+        return results
+
+    def _enqueue(self) -> dict:
+        payload = {
+            "clicks": [{**c, "created_at": p["created_at"]} for c, p in zip(self.clicks, self._pending["clicks"])],
+            "coin_transactions": [{**t, "created_at": p["created_at"]} for t, p in zip(self.transactions, self._pending["coin_transactions"])],
+            "preferences": self.preferences
+        }
+        source = get_backend().key
+        mirrors = {t: _get_table_mirror(source, t) for t in ("clicks", "coin_transactions")}
+        totals = {t: _get_totals_state(source, t) for t in mirrors}
+        entry_id = _get_write_queue(source).enqueue(
+            payload, on_recorded=lambda entry_id: _queue_pending_rows(mirrors, totals, entry_id, payload)
+        )
+        self.clicks, self.transactions, self.preferences = [], [], {}
+        self._pending = {"clicks": [], "coin_transactions": []}
+        return {"queued": entry_id}
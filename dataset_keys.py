@@ -0,0 +1,62 @@
+import pickle
+import weakref
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+# Cheap cache keys for the shared dataset. Streamlit hashes every argument of a cached function on
+# each call; for the full click/transaction lists and the frames built from them that is O(rows).
+# Snapshots from database.get_data()/get_transactions() carry a version instead, and the frames
+# process_raw_data builds from one are registered here under that version.
+
+# id(frame) -> (weak reference, dataset key, fingerprint at registration)
+_FRAME_KEYS = {}
+
+def _fingerprint(df: pd.DataFrame) -> tuple:
+    # Catches the usual in-place edits of a handed-out view (rows, columns or a column's dtype changed).
+    # Values overwritten in place are NOT caught: see tag_frame.
+    return (len(df), tuple(df.columns), tuple(str(t) for t in df.dtypes))
+
+def tag_frame(df: pd.DataFrame, key) -> pd.DataFrame:
+    """
+    Registers `key` as the cache key of this exact frame object for as long as it lives.
+
+    DO NOT MUTATE A TAGGED FRAME. Downstream caches and the incremental stores trust the key
+    and never look at the values again: overwriting a column in place (e.g. df["created_at"] = ...)
+    keeps the fingerprint and therefore serves results of the original data. Adding or dropping
+    rows or columns, or changing a dtype, drops the key (every cache then recomputes from scratch).
+    Callers that need other values work on a .copy() of the frame.
+    """
+    frame_id = id(df)
+    ref = weakref.ref(df, lambda _ref: _FRAME_KEYS.pop(frame_id, None))
+    _FRAME_KEYS[frame_id] = (ref, key, _fingerprint(df))
+    return df
+
+def registered_key(df: pd.DataFrame):
+    """The dataset key `df` was tagged with, or None for untagged (or since modified) frames."""
+    entry = _FRAME_KEYS.get(id(df))
+    if entry is not None and entry[0]() is df and entry[2] == _fingerprint(df):
+        return entry[1]
+    return None
+
+def dataset_key(rows):
+    """Hash of a database.FrozenRows snapshot: its (source, table, version, projection)."""
+    if rows.version is None:
+        return list(rows)
+    return rows.version
+
+def frame_key(df: pd.DataFrame):
+    """Hash of a DataFrame: its registered dataset key, or its contents when it is not a tagged view."""
+    key = registered_key(df)
+    if key is not None:
+        return key
+    try:
+        return (df.shape, tuple(str(c) for c in df.columns), hash_pandas_object(df).to_numpy().tobytes())
+    except TypeError:
+        # Unhashable cells (e.g. the JSON location dicts)
+        return pickle.dumps(df, pickle.HIGHEST_PROTOCOL)
+
+# hash_funcs for st.cache_data / st.cache_resource functions that take the dataset as an argument
+DATASET_HASH_FUNCS = {
+    "database.FrozenRows": dataset_key,
+    pd.DataFrame: frame_key
+}
@@ -0,0 +1,29 @@
+"""Drink catalog: the drink_ids the clicks table stores and the caffeine and price assumptions every metric reads."""
+import pandas as pd
+
+DRINK_CATALOG = {
+    1: {"name": "Hot Coffee", "category": "coffee", "temperature": "hot", "mg": 95, "cost": 2.50},
+    2: {"name": "Hot Tea", "category": "tea", "temperature": "hot", "mg": 35, "cost": 1.50},
+    3: {"name": "Iced Coffee", "category": "coffee", "temperature": "iced", "mg": 95, "cost": 2.50},
+    4: {"name": "Iced Tea", "category": "tea", "temperature": "iced", "mg": 35, "cost": 1.50},
+}
+
+# The catalog as a frame indexed by drink_id, for vectorized lookups: events["drink_id"].map(DRINK_TABLE["mg"])
+DRINK_TABLE = pd.DataFrame.from_dict(DRINK_CATALOG, orient="index").rename_axis("drink_id")
+
+COFFEE_IDS = [d for d, info in DRINK_CATALOG.items() if info["category"] == "coffee"]
+TEA_IDS = [d for d, info in DRINK_CATALOG.items() if info["category"] == "tea"]
+ICED_IDS = [d for d, info in DRINK_CATALOG.items() if info["temperature"] == "iced"]
+HOT_IDS = [d for d, info in DRINK_CATALOG.items() if info["temperature"] == "hot"]
+
+# Per-category assumptions (hot and iced versions of a drink share them)
+COFFEE_MG = DRINK_CATALOG[1]["mg"]
+TEA_MG = DRINK_CATALOG[2]["mg"]
+COFFEE_COST = DRINK_CATALOG[1]["cost"]
+TEA_COST = DRINK_CATALOG[2]["cost"]
+
+def caffeine_mg(drink_id, value=1):
+    """Caffeine in mg of `value` drinks of `drink_id`; works on scalars and on aligned Series."""
+    if isinstance(drink_id, pd.Series):
+        return drink_id.astype("int64").map(DRINK_TABLE["mg"]).fillna(0).astype("int64") * value
+    return DRINK_CATALOG.get(drink_id, {}).get("mg", 0) * value
@@ -7,11 +7,16 @@ from gamification.hall_of_fame import (
     compute_monarch_hall_of_fame,
     compute_all_trophy_hall_of_fames
 )
+from gamification.streaks import user_streaks
 from gamification.engine import (
     get_gamification_metrics,
     get_user_titles,
     resolve_user_title
 )
+from gamification.progress import (
+    CrewProgress,
+    get_crew_progress
+)
 
 __all__ = [
     "ACHIEVEMENT_TIERS",
@@ -19,7 +24,10 @@ __all__ = [
     "ACHIEVEMENTS_START_DATE",
     "compute_monarch_hall_of_fame",
     "compute_all_trophy_hall_of_fames",
+    "user_streaks",
     "get_gamification_metrics",
     "get_user_titles",
-    "resolve_user_title"
+    "resolve_user_title",
+    "CrewProgress",
+    "get_crew_progress"
 ]
@@ -1,11 +1,167 @@
 import streamlit as st
 import pandas as pd
 import random
+from dataset_keys import DATASET_HASH_FUNCS
 from world_data import compute_passport_stats, is_coffee_capital
 from gamification.achievements import ACHIEVEMENT_TIERS, SECRET_FEATS, ACHIEVEMENTS_START_DATE
 from gamification.hall_of_fame import compute_monarch_hall_of_fame, compute_all_trophy_hall_of_fames
+from gamification.streaks import user_streaks
+from gamification.features import localized_events, daily_features
+from drinks import DRINK_CATALOG, COFFEE_IDS, ICED_IDS, HOT_IDS
 
-@st.cache_data(show_spinner=False)
+USER_STAT_COLUMNS = [
+    "logs", "coffee_logs", "tea_logs", "coffee", "tea", "iced", "early", "night", "weekend",
+    "active_days", "surge", "combustion", "avg_gap", "max_gap", "mono_run", "mono_drink"
+]
+
+def _user_stats(events, users, daily=None):
+    """
+    Every per-user statistic of the engine from one groupby-by-user pass over `events` (sorted as
+    localized_events returns them) and its daily_features table; one row per crew member, in `users` order.
+    """
+    if events.empty:
+        stats = pd.DataFrame(0, index=pd.Index(users, name="user_name"), columns=USER_STAT_COLUMNS)
+        stats[["avg_gap", "max_gap"]] = pd.NaT
+        stats["mono_drink"] = None
+        return stats
+
+    user = events["user_name"]
+    drink = events["drink_id"]
+    same_user = user.eq(user.shift())
+    gap = events["created_at"].diff().where(same_user)
+    gaps = pd.DataFrame({"user_name": user, "gap": gap, "valid_gap": gap.where(gap >= pd.Timedelta(minutes=1))})
+
+    # Counters, active days, surge (>= 3 drinks) and combustion (>= 400 mg) days from the daily feature table
+    daily = daily_features(events) if daily is None else daily
+    by_user = daily.index.get_level_values("user_name")
+    is_weekend = daily.index.get_level_values("day").dayofweek.isin([5, 6])
+    stats = daily[["logs", "coffee_logs", "tea_logs", "coffee", "tea", "iced", "early", "night"]].groupby(by_user).sum()
+    stats["weekend"] = daily["drinks"].where(is_weekend, 0).groupby(by_user).sum()
+    stats["active_days"] = daily.groupby(by_user).size()
+    stats["surge"] = (daily["drinks"] >= 3).groupby(by_user).sum()
+    stats["combustion"] = (daily["caffeine_mg"] >= 400).groupby(by_user).sum()
+    gap_stats = gaps.groupby("user_name", observed=True).agg(avg_gap=("valid_gap", "mean"), max_gap=("gap", "max"))
+    stats["avg_gap"] = gap_stats["avg_gap"]
+    stats["max_gap"] = gap_stats["max_gap"]
+
+    # Longest run of the same drink_id, and the drink of the first run reaching it
+    runs = (~same_user | drink.ne(drink.shift())).cumsum()
+    run_table = pd.DataFrame({"user_name": user, "drink_id": drink, "run": runs}).groupby("run").agg(
+        user_name=("user_name", "first"), drink_id=("drink_id", "first"), length=("drink_id", "size")
+    )
+    best_runs = run_table.loc[run_table.groupby("user_name", observed=True)["length"].idxmax()].set_index("user_name")
+    stats["mono_run"] = best_runs["length"]
+    stats["mono_drink"] = best_runs["drink_id"]
+
+    stats.index = stats.index.astype(object)
+    stats = stats.reindex(users)
+    counts = [c for c in USER_STAT_COLUMNS if c not in ("avg_gap", "max_gap", "mono_drink")]
+    stats[counts] = stats[counts].fillna(0).astype(int)
+    return stats
+
+def build_achievement_tracks(stats_map):
+    """Personal achievement tracks (tiers with unlocked state and progress) for one user's `stats_map` values."""
+    user_achievements = {}
+    for cat_key, cat_data in ACHIEVEMENT_TIERS.items():
+        current_val = stats_map.get(cat_key, 0)
+        tier_list = []
+        for tier in cat_data["tiers"]:
+            target = tier["target"]
+            unlocked = bool(current_val >= target)
+            progress = min(1.0, current_val / target) if target > 0 else 1.0
+            tier_list.append({
+                "level": tier["level"],
+                "name": tier["name"],
+                "target": target,
+                "current": current_val,
+                "unlocked": unlocked,
+                "progress": progress,
+                "progress_pct": progress
+            })
+        user_achievements[cat_key] = {
+            "title": cat_data["title"],
+            "icon": cat_data["icon"],
+            "desc": cat_data["desc"],
+            "current_val": current_val,
+            "tiers": tier_list
+        }
+    return user_achievements
+
+PASSPORT_SECRETS = ["continent_hopper", "jet_lagged", "homebody", "capital_tour", "twin_cities", "coffee_capital", "mile_high"]
+
+def passport_secrets(passport):
+    """The travel secret feats from a user's post-release passport stats ({} when there are none)."""
+    if not passport:
+        return {s_id: False for s_id in PASSPORT_SECRETS}
+    coffee_caps_count = sum(passport.get("city_counts", {}).get(k, 0) for k in passport.get("city_counts", {}) if is_coffee_capital(k[1]))
+    return {
+        "continent_hopper": len(passport.get("continents_visited", set())) >= 3,
+        "jet_lagged": passport.get("jet_lagged", False),
+        "homebody": passport.get("max_home_streak", 0) >= 100,
+        "capital_tour": len(passport.get("capital_cities_visited", set())) >= 3,
+        "twin_cities": any(len(cities) >= 2 for cities in passport.get("country_cities_map", {}).values()),
+        "coffee_capital": bool(len(passport.get("coffee_capitals_visited", set())) >= 2 or coffee_caps_count >= 3),
+        "mile_high": bool(passport.get("in_flight_drinks", 0) >= 1)
+    }
+
+ACTIVITY_SECRETS = [
+    "phantom", "clockwork", "power_nap", "cursed_fusion", "overclock",
+    "monastic", "high_noon", "all_nighter", "alchemist", "thermal_sandwich"
+]
+
+def _secret_feats(events, stats):
+    """
+    The log-pattern secret feats of every user in `stats` (built by _user_stats from the same
+    `events`), evaluated with shifted-array comparisons over the user-sorted logs: O(n) overall.
+    """
+    users = list(stats.index)
+    feats = pd.DataFrame(False, index=pd.Index(users, name="user_name"), columns=ACTIVITY_SECRETS)
+    if events.empty:
+        return feats
+
+    user = events["user_name"]
+    times = events["created_at"]
+    hour = events["hour"]
+    minute = events["local_dt"].dt.minute
+    drink = events["drink_id"]
+    is_coffee = drink.isin(COFFEE_IDS)
+    is_iced = drink.isin(ICED_IDS)
+    is_hot = drink.isin(HOT_IDS)
+
+    def ahead(k):
+        # The log k positions later belongs to the same user
+        return user.eq(user.shift(-k))
+
+    # Seconds to the user's next log (NaN on each user's last log)
+    gap = (times.shift(-1) - times).dt.total_seconds().where(ahead(1))
+    flags = pd.DataFrame({
+        "user_name": user,
+        "phantom": hour.eq(3),
+        "clockwork": minute.eq(0),
+        "power_nap": gap.between(18 * 60, 25 * 60),
+        "cursed_fusion": gap.le(90) & is_coffee.ne(is_coffee.shift(-1, fill_value=False)),
+        # 4 drinks within 2 hours <=> some log's 3rd successor is at most 2 hours later
+        "overclock": ahead(3) & (times.shift(-3) - times).le(pd.Timedelta(hours=2)),
+        "high_noon": hour.eq(12) & minute.le(5),
+        "thermal_sandwich": ahead(2) & is_iced & is_hot.shift(-1, fill_value=False) & is_iced.shift(-2, fill_value=False)
+    })
+    found = flags.groupby("user_name", observed=True).any()
+    found.index = found.index.astype(object)
+    for col in found.columns:
+        feats[col] = found[col].reindex(feats.index, fill_value=False).astype(bool)
+
+    # A log at 23:00 or later followed by one before 06:00 on the next local day
+    late = events.loc[hour >= 23, ["user_name", "day"]]
+    early = events.loc[hour < 6, ["user_name", "day"]].assign(day=lambda f: f["day"] - pd.Timedelta(days=1))
+    feats["all_nighter"] = feats.index.isin(set(late.merge(early, on=["user_name", "day"])["user_name"].astype(str)))
+
+    kinds = events[drink.isin(list(DRINK_CATALOG))].groupby("user_name", observed=True)["drink_id"].nunique()
+    kinds.index = kinds.index.astype(object)
+    feats["alchemist"] = kinds.reindex(feats.index, fill_value=0).ge(len(DRINK_CATALOG))
+    feats["monastic"] = stats["mono_run"].ge(35)
+    return feats
+
+@st.cache_data(show_spinner=False, hash_funcs=DATASET_HASH_FUNCS)
 def get_gamification_metrics(df_coffee, df_tea, users, transactions=None, achievements_start_date=ACHIEVEMENTS_START_DATE):
     """
     Computes all gamification metrics, monarch thrones, personal milestone tiers, and secret feats.
@@ -24,40 +180,15 @@ def get_gamification_metrics(df_coffee, df_tea, users, transactions=None, achiev
     }
     
     combined = pd.concat([df_coffee, df_tea]) if not df_coffee.empty or not df_tea.empty else pd.DataFrame()
+    # Shared pre-localized frame and all-time per-user statistics, computed once for every section
+    events = localized_events(combined) if not combined.empty else pd.DataFrame()
+    daily = daily_features(events)
+    stats = _user_stats(events, users, daily)
 
-    # 1. Historical Monthly Records (All-time)
+    # 1. Historical Monthly Records (All-time): one groupby over the daily rollups, closed months kept across syncs
     if not combined.empty:
-        combined_copy = combined.copy()
-        combined_copy["month_str"] = combined_copy["created_at"].dt.strftime("%Y-%m")
-        months = sorted(combined_copy["month_str"].unique(), reverse=True)
-        
-        records = []
-        for m in months:
-            month_data = combined_copy[combined_copy["month_str"] == m]
-            
-            c_data = month_data[month_data["drink_id"].isin([1, 3])]
-            t_data = month_data[month_data["drink_id"].isin([2, 4])]
-            
-            top_c = "-"
-            if not c_data.empty:
-                c_counts = c_data.groupby("user_name")["value"].sum()
-                if not c_counts.empty:
-                    top_c = f"{c_counts.idxmax()} ({int(c_counts.max())})"
-                    
-            top_t = "-"
-            if not t_data.empty:
-                t_counts = t_data.groupby("user_name")["value"].sum()
-                if not t_counts.empty:
-                    top_t = f"{t_counts.idxmax()} ({int(t_counts.max())})"
-                    
-            month_name = pd.to_datetime(m + "-01").strftime("%B %Y")
-            records.append({
-                "Month": month_name,
-                "☕ Coffee Monarch": top_c,
-                "🍵 Tea Monarch": top_t
-            })
-            
-        trophies["monthly_records"] = records
+        from data_processing import get_monthly_records
+        trophies["monthly_records"] = get_monthly_records(df_coffee, df_tea)
             
     # 2. Reigning Monarchs
     # Caffeine Monarch of the Week (Most coffees in last 7 days)
@@ -65,27 +196,21 @@ def get_gamification_metrics(df_coffee, df_tea, users, transactions=None, achiev
         seven_days_ago = pd.Timestamp.now(tz=df_coffee["created_at"].dt.tz) - pd.Timedelta(days=7)
         recent_coffees = df_coffee[df_coffee["created_at"] >= seven_days_ago]
         if not recent_coffees.empty:
-            counts = recent_coffees.groupby("user_name")["value"].sum()
+            counts = recent_coffees.groupby("user_name", observed=True)["value"].sum()
             if not counts.empty:
                 trophies["caffeine_addict"] = counts.idxmax()
                 
-    # Tea Monarch / Purist (Highest Tea-to-Coffee ratio)
-    best_ratio = -1
-    for user in users:
-        c_count = len(df_coffee[df_coffee["user_name"] == user]) if not df_coffee.empty else 0
-        t_count = len(df_tea[df_tea["user_name"] == user]) if not df_tea.empty else 0
-        
-        if t_count > 0:
-            ratio = t_count / (c_count + 1)
-            if ratio > best_ratio:
-                best_ratio = ratio
-                trophies["tea_purist"] = user
+    # Tea Monarch / Purist (Highest Tea-to-Coffee ratio); ties go to the first user in crew order
+    tea_drinkers = stats[stats["tea_logs"] > 0]
+    if not tea_drinkers.empty:
+        ratios = tea_drinkers["tea_logs"] / (tea_drinkers["coffee_logs"] + 1)
+        trophies["tea_purist"] = ratios.idxmax()
 
     # Sub-Zero Monarch (Most Iced Drinks all-time)
     if not combined.empty and "drink_id" in combined.columns:
         iced_logs = combined[combined["drink_id"].isin([3, 4])]
         if not iced_logs.empty:
-            ice_counts = iced_logs.groupby("user_name")["value"].sum()
+            ice_counts = iced_logs.groupby("user_name", observed=True)["value"].sum()
             if not ice_counts.empty:
                 trophies["ice_monarch"] = {
                     "user": ice_counts.idxmax(),
@@ -93,93 +218,30 @@ def get_gamification_metrics(df_coffee, df_tea, users, transactions=None, achiev
                 }
 
     # Combustion Monarch (Most On-Fire days with >= 400 mg caffeine)
-    best_fire_user = None
-    best_fire_days = 0
-    for user in users:
-        if not combined.empty:
-            u_logs = combined[combined["user_name"] == user].copy()
-            if not u_logs.empty:
-                if u_logs["created_at"].dt.tz is None:
-                    u_logs["created_at"] = u_logs["created_at"].dt.tz_localize("UTC")
-                u_logs["created_at"] = u_logs["created_at"].dt.tz_convert("Europe/Madrid")
-                u_logs["date_only"] = u_logs["created_at"].dt.date
-                def calc_caff_m(r):
-                    val = r["value"]
-                    did = r["drink_id"]
-                    return val * 95 if did in [1, 3] else val * 35
-                u_logs["caffeine_mg"] = u_logs.apply(calc_caff_m, axis=1)
-                daily_caff = u_logs.groupby("date_only")["caffeine_mg"].sum()
-                fire_days = int((daily_caff >= 400).sum())
-                if fire_days > best_fire_days:
-                    best_fire_days = fire_days
-                    best_fire_user = user
-                    
-    if best_fire_user and best_fire_days > 0:
+    if stats["combustion"].max() > 0:
         trophies["combustion_monarch"] = {
-            "user": best_fire_user,
-            "count": best_fire_days
+            "user": stats["combustion"].idxmax(),
+            "count": int(stats["combustion"].max())
         }
 
-    # 3. Streaks (Active consecutive days logging ANY drink)
-    longest_streak_user = None
-    longest_streak_val = 0
-    for user in users:
-        trophies["streaks"][user] = 0
-        if not combined.empty:
-            user_logs = combined[combined["user_name"] == user].copy()
-            if not user_logs.empty:
-                # Calculate Longest Historical Streak (All-Time)
-                dates_asc = user_logs["created_at"].dt.normalize().drop_duplicates().sort_values().tolist()
-                if dates_asc:
-                    current_len = 1
-                    max_len = 1
-                    for i in range(1, len(dates_asc)):
-                        if dates_asc[i] - dates_asc[i-1] == pd.Timedelta(days=1):
-                            current_len += 1
-                            if current_len > max_len:
-                                max_len = current_len
-                        else:
-                            current_len = 1
-                    if max_len > longest_streak_val:
-                        longest_streak_val = max_len
-                        longest_streak_user = user
-
-                # Calculate Active Streak
-                dates_desc = user_logs["created_at"].dt.normalize().drop_duplicates().sort_values(ascending=False).tolist()
-                if dates_desc:
-                    today = pd.Timestamp.now(tz=dates_desc[0].tz).normalize()
-                    if dates_desc[0] >= today - pd.Timedelta(days=1):
-                        streak = 1
-                        for i in range(1, len(dates_desc)):
-                            if dates_desc[i-1] - dates_desc[i] == pd.Timedelta(days=1):
-                                streak += 1
-                            else:
-                                break
-                        trophies["streaks"][user] = streak
-                
-    if longest_streak_user and longest_streak_val > 0:
+    # 3. Streaks (Active consecutive Madrid-local days logging ANY drink)
+    streaks = user_streaks(events["user_name"], events["day"], users) if not events.empty else user_streaks([], [], users)
+    trophies["streaks"] = {user: int(streaks.at[user, "current"]) for user in users}
+    if streaks["best"].max() > 0:
         trophies["longest_historical_streak"] = {
-            "user": longest_streak_user,
-            "days": longest_streak_val
+            "user": streaks["best"].idxmax(),
+            "days": int(streaks["best"].max())
         }
 
-    # 4. Most Coffees in a Single Day (All-Time)
+    # 4. Most Coffees in a Single Day (All-Time), earliest day (then first name) on ties
     if not df_coffee.empty:
-        df_coffee_copy = df_coffee.copy()
-        if df_coffee_copy["created_at"].dt.tz is None:
-            df_coffee_copy["created_at"] = df_coffee_copy["created_at"].dt.tz_localize("UTC")
-        df_coffee_copy["created_at"] = df_coffee_copy["created_at"].dt.tz_convert("Europe/Madrid")
-        
-        df_coffee_copy["date_str"] = df_coffee_copy["created_at"].dt.normalize().astype(str)
-        daily_coffees = df_coffee_copy.groupby(["date_str", "user_name"])["value"].sum().reset_index()
-        if not daily_coffees.empty:
-            max_idx = daily_coffees["value"].idxmax()
-            best_day = daily_coffees.loc[max_idx]
-            trophies["most_coffees_in_a_day"] = {
-                "user": best_day["user_name"],
-                "count": int(best_day["value"]),
-                "date": best_day["date_str"]
-            }
+        by_day = daily.reorder_levels(["day", "user_name"]).sort_index()["coffee"]
+        best_day, best_user = by_day.idxmax()
+        trophies["most_coffees_in_a_day"] = {
+            "user": best_user,
+            "count": int(by_day.max()),
+            "date": str(best_day.tz_localize("Europe/Madrid"))
+        }
 
     # 5. Funny Stats (Timezone Aware: Europe/Madrid)
     trophies["funny_stats"] = {
@@ -200,16 +262,16 @@ def get_gamification_metrics(df_coffee, df_tea, users, transactions=None, achiev
         # 1. Night Owl (20:00 to 04:00)
         night_owls = df_local[df_local["hour"].isin([20, 21, 22, 23, 0, 1, 2, 3])]
         if not night_owls.empty:
-            trophies["funny_stats"]["night_owl"] = night_owls.groupby("user_name").size().idxmax()
+            trophies["funny_stats"]["night_owl"] = night_owls.groupby("user_name", observed=True).size().idxmax()
             
         # 2. Early Bird (04:00 to 08:00)
         early_birds = df_local[df_local["hour"].isin([4, 5, 6, 7])]
         if not early_birds.empty:
-            trophies["funny_stats"]["early_bird"] = early_birds.groupby("user_name").size().idxmax()
+            trophies["funny_stats"]["early_bird"] = early_birds.groupby("user_name", observed=True).size().idxmax()
             
         # 3. Speedrunner & Marathon
         df_local["date_str"] = df_local["created_at"].dt.normalize().astype(str)
-        hourly_counts = df_local.groupby(["user_name", "date_str", "hour"])["value"].sum().reset_index()
+        hourly_counts = df_local.groupby(["user_name", "date_str", "hour"], observed=True)["value"].sum().reset_index()
         if not hourly_counts.empty:
             max_idx = hourly_counts["value"].idxmax()
             best_hour = hourly_counts.loc[max_idx]
@@ -221,40 +283,21 @@ def get_gamification_metrics(df_coffee, df_tea, users, transactions=None, achiev
                     "hour": int(best_hour['hour'])
                 }
                 
-        max_avg_gap = pd.Timedelta.min
-        marathon_user = None
-        for user in users:
-            user_logs = df_local[df_local["user_name"] == user].sort_values("created_at")
-            if len(user_logs) > 1:
-                gaps = user_logs["created_at"].diff().dropna()
-                valid_gaps = gaps[gaps >= pd.Timedelta(minutes=1)]
-                if not valid_gaps.empty:
-                    user_avg = valid_gaps.mean()
-                    if user_avg > max_avg_gap:
-                        max_avg_gap = user_avg
-                        marathon_user = user
-            
-        if marathon_user:
-            hours = int(max_avg_gap.total_seconds() / 3600)
+        # Marathon: longest average gap between drinks (gaps under a minute are double taps)
+        avg_gaps = stats["avg_gap"].dropna()
+        if not avg_gaps.empty:
+            marathon_user = avg_gaps.idxmax()
+            hours = int(avg_gaps.max().total_seconds() / 3600)
             trophies["funny_stats"]["marathon"] = f"{marathon_user} ({hours}h avg gap)"
             
         # 4. Perfectly Balanced (Closest to 50/50 ratio)
-        best_diff = 1.0
-        balanced_user = None
-        for user in users:
-            user_logs = df_local[df_local["user_name"] == user]
-            if not user_logs.empty and len(user_logs) > 4:
-                c_count = len(user_logs[user_logs["drink_id"].isin([1, 3])])
-                t_count = len(user_logs[user_logs["drink_id"].isin([2, 4])])
-                total = c_count + t_count
-                if total > 0:
-                    diff = abs((c_count / total) - (t_count / total))
-                    if diff < best_diff:
-                        best_diff = diff
-                        balanced_user = user
-                        
-        if balanced_user:
-            trophies["funny_stats"]["balanced"] = balanced_user
+        eligible = stats[(stats["logs"] > 4) & (stats["coffee_logs"] + stats["tea_logs"] > 0)]
+        if not eligible.empty:
+            total = eligible["coffee_logs"] + eligible["tea_logs"]
+            diffs = ((eligible["coffee_logs"] / total) - (eligible["tea_logs"] / total)).abs()
+            diffs = diffs[diffs < 1.0]
+            if not diffs.empty:
+                trophies["funny_stats"]["balanced"] = diffs.idxmin()
 
         # 5. All-Time Fun Records
         df_local["dayofweek"] = df_local["created_at"].dt.dayofweek
@@ -262,36 +305,27 @@ def get_gamification_metrics(df_coffee, df_tea, users, transactions=None, achiev
         
         mondays = df_local[(df_local["dayofweek"] == 0) & (df_local["drink_id"].isin([1, 3]))]
         if not mondays.empty:
-            counts = mondays.groupby("user_name")["value"].sum()
+            counts = mondays.groupby("user_name", observed=True)["value"].sum()
             if not counts.empty:
                 trophies["monday_grump"] = {"user": counts.idxmax(), "count": int(counts.max())}
                 
         weekends = df_local[df_local["dayofweek"].isin([5, 6])]
         if not weekends.empty:
-            weekly_sums = weekends.groupby(["user_name", "year_week"])["value"].sum().reset_index()
-            averages = weekly_sums.groupby("user_name")["value"].mean()
+            weekly_sums = weekends.groupby(["user_name", "year_week"], observed=True)["value"].sum().reset_index()
+            averages = weekly_sums.groupby("user_name", observed=True)["value"].mean()
             if not averages.empty:
                 trophies["weekend_warrior"] = {"user": averages.idxmax(), "count": round(averages.max(), 1)}
                 
         weekdays = df_local[df_local["dayofweek"].isin([0, 1, 2, 3, 4])]
         if not weekdays.empty:
-            weekly_sums = weekdays.groupby(["user_name", "year_week"])["value"].sum().reset_index()
-            averages = weekly_sums.groupby("user_name")["value"].mean()
+            weekly_sums = weekdays.groupby(["user_name", "year_week"], observed=True)["value"].sum().reset_index()
+            averages = weekly_sums.groupby("user_name", observed=True)["value"].mean()
             if not averages.empty:
                 trophies["weekday_warrior"] = {"user": averages.idxmax(), "count": round(averages.max(), 1)}
                 
-        max_gap = pd.Timedelta.min
-        quitter_user = None
-        for user in users:
-            user_logs = df_local[df_local["user_name"] == user].sort_values("created_at")
-            if len(user_logs) > 1:
-                gaps = user_logs["created_at"].diff().dropna()
-                user_max = gaps.max()
-                if user_max > max_gap:
-                    max_gap = user_max
-                    quitter_user = user
-        if quitter_user and max_gap > pd.Timedelta(days=1):
-            trophies["dry_spell"] = {"user": quitter_user, "days": max_gap.days}
+        max_gaps = stats["max_gap"].dropna()
+        if not max_gaps.empty and max_gaps.max() > pd.Timedelta(days=1):
+            trophies["dry_spell"] = {"user": max_gaps.idxmax(), "days": max_gaps.max().days}
             
         late_night = df_local[df_local["hour"].isin([0, 1, 2, 3, 4])].copy()
         if not late_night.empty:
@@ -302,86 +336,42 @@ def get_gamification_metrics(df_coffee, df_tea, users, transactions=None, achiev
                 "time": latest_drink["created_at"].strftime("%H:%M")
             }
             
-        monogamist_user = None
-        monogamist_streak = 0
-        monogamist_drink = None
-        for user in users:
-            user_logs = df_local[df_local["user_name"] == user].sort_values("created_at")
-            if not user_logs.empty:
-                drinks = user_logs["drink_id"].tolist()
-                current_streak = 1
-                current_drink = drinks[0]
-                for i in range(1, len(drinks)):
-                    if drinks[i] == current_drink:
-                        current_streak += 1
-                        if current_streak > monogamist_streak:
-                            monogamist_streak = current_streak
-                            monogamist_user = user
-                            monogamist_drink = "Coffee" if current_drink in [1, 3] else "Tea"
-                    else:
-                        current_drink = drinks[i]
-                        current_streak = 1
-        if monogamist_user and monogamist_streak > 1:
-            trophies["monogamist"] = {"user": monogamist_user, "streak": monogamist_streak, "drink": monogamist_drink}
+        if stats["mono_run"].max() > 1:
+            monogamist_user = stats["mono_run"].idxmax()
+            monogamist_drink = "Coffee" if stats.at[monogamist_user, "mono_drink"] in [1, 3] else "Tea"
+            trophies["monogamist"] = {"user": monogamist_user, "streak": int(stats["mono_run"].max()), "drink": monogamist_drink}
 
     # 6. Personal Tiered Achievements & Secret Feats (Progression starting from achievements_start_date)
     # Filter logs to achievement release cutoff if start date specified
-    if not combined.empty and achievements_start_date is not None:
-        if combined["created_at"].dt.tz is None:
-            combined_tz = combined["created_at"].dt.tz_localize("UTC")
-        else:
-            combined_tz = combined["created_at"]
-        ach_cutoff_tz = achievements_start_date.tz_convert(combined_tz.dt.tz) if achievements_start_date.tz else achievements_start_date
-        ach_active_df = combined[combined_tz >= ach_cutoff_tz].copy()
+    if not events.empty and achievements_start_date is not None:
+        ach_cutoff_tz = achievements_start_date.tz_convert(events["created_at"].dt.tz) if achievements_start_date.tz else achievements_start_date
+        ach_events = events[events["created_at"] >= ach_cutoff_tz]
     else:
-        ach_active_df = combined.copy() if not combined.empty else pd.DataFrame()
+        ach_events = events
+    ach_stats = _user_stats(ach_events, users)
+    ach_streaks = user_streaks(ach_events["user_name"], ach_events["day"], users) if not ach_events.empty else user_streaks([], [], users)
+    ach_feats = _secret_feats(ach_events, ach_stats)
+    ach_groups = dict(tuple(ach_events.groupby("user_name", observed=True))) if not ach_events.empty else {}
 
     for user in users:
-        user_logs = ach_active_df[ach_active_df["user_name"] == user].copy() if not ach_active_df.empty else pd.DataFrame()
+        user_logs = ach_groups.get(user, pd.DataFrame())
         
         if not user_logs.empty:
-            if user_logs["created_at"].dt.tz is None:
-                user_logs["created_at"] = user_logs["created_at"].dt.tz_localize("UTC")
-            user_logs["created_at"] = user_logs["created_at"].dt.tz_convert("Europe/Madrid")
-            user_logs["date_only"] = user_logs["created_at"].dt.date
-            user_logs["hour"] = user_logs["created_at"].dt.hour
-            user_logs["dayofweek"] = user_logs["created_at"].dt.dayofweek
-            
-            u_coffee = int(user_logs[user_logs["drink_id"].isin([1, 3])]["value"].sum())
-            u_tea = int(user_logs[user_logs["drink_id"].isin([2, 4])]["value"].sum())
+            # Madrid-local view of the user's post-release logs (read by the streak, feats and passport checks)
+            user_logs = user_logs.assign(created_at=user_logs["local_dt"], date_only=user_logs["local_dt"].dt.date)
+            u = ach_stats.loc[user]
+            u_coffee = int(u["coffee"])
+            u_tea = int(u["tea"])
             u_total = u_coffee + u_tea
-            u_iced = int(user_logs[user_logs["drink_id"].isin([3, 4])]["value"].sum())
-            u_active_days = int(user_logs["date_only"].nunique())
-            
-            dates_asc = user_logs["created_at"].dt.normalize().drop_duplicates().sort_values().tolist()
-            u_max_streak = 0
-            if dates_asc:
-                cur_s = 1
-                u_max_streak = 1
-                for i in range(1, len(dates_asc)):
-                    if dates_asc[i] - dates_asc[i-1] == pd.Timedelta(days=1):
-                        cur_s += 1
-                        if cur_s > u_max_streak:
-                            u_max_streak = cur_s
-                    else:
-                        cur_s = 1
-                        
-            u_early = int(user_logs[user_logs["hour"] < 9]["value"].sum())
-            u_night = int(user_logs[user_logs["hour"] >= 19]["value"].sum())
+            u_iced = int(u["iced"])
+            u_active_days = int(u["active_days"])
             
-            daily_drink_counts = user_logs.groupby("date_only")["value"].sum()
-            u_surge_days = int((daily_drink_counts >= 3).sum())
-            
-            weekend_logs = user_logs[user_logs["dayofweek"].isin([5, 6])]
-            u_weekend = int(weekend_logs["value"].sum()) if not weekend_logs.empty else 0
-            
-            def calc_caff(r):
-                val = r["value"]
-                did = r["drink_id"]
-                return val * 95 if did in [1, 3] else val * 35
-            user_logs["caffeine_mg"] = user_logs.apply(calc_caff, axis=1)
-            daily_caff = user_logs.groupby("date_only")["caffeine_mg"].sum()
-            u_combustion_days = int((daily_caff >= 400).sum())
+            u_max_streak = int(ach_streaks.at[user, "best"])
+            u_early = int(u["early"])
+            u_night = int(u["night"])
+            u_surge_days = int(u["surge"])
+            u_weekend = int(u["weekend"])
+            u_combustion_days = int(u["combustion"])
             
             # Passport stats (strictly from post-release logs)
             passport = compute_passport_stats(transactions=None, user=user, clicks_data=user_logs)
@@ -410,134 +400,18 @@ def get_gamification_metrics(df_coffee, df_tea, users, transactions=None, achiev
             "metropolis_explorer": u_cities
         }
 
-        user_achievements = {}
-        for cat_key, cat_data in ACHIEVEMENT_TIERS.items():
-            current_val = stats_map.get(cat_key, 0)
-            tier_list = []
-            for tier in cat_data["tiers"]:
-                target = tier["target"]
-                unlocked = bool(current_val >= target)
-                progress = min(1.0, current_val / target) if target > 0 else 1.0
-                tier_list.append({
-                    "level": tier["level"],
-                    "name": tier["name"],
-                    "target": target,
-                    "current": current_val,
-                    "unlocked": unlocked,
-                    "progress": progress,
-                    "progress_pct": progress
-                })
-            user_achievements[cat_key] = {
-                "title": cat_data["title"],
-                "icon": cat_data["icon"],
-                "desc": cat_data["desc"],
-                "current_val": current_val,
-                "tiers": tier_list
-            }
-        trophies["personal_achievements"][user] = user_achievements
+        trophies["personal_achievements"][user] = build_achievement_tracks(stats_map)
 
         # Secret Feats Evaluation
-        user_secrets = {}
-        if not user_logs.empty:
-            logs_chrono = user_logs.sort_values("created_at").reset_index(drop=True)
-            times = logs_chrono["created_at"]
-            
-            user_secrets["phantom"] = bool((logs_chrono["hour"] == 3).any())
-            user_secrets["clockwork"] = bool((times.dt.minute == 0).any())
-            
-            has_power_nap = False
-            has_cursed_fusion = False
-            for i in range(len(logs_chrono) - 1):
-                delta = (times.iloc[i+1] - times.iloc[i]).total_seconds()
-                if 18 * 60 <= delta <= 25 * 60:
-                    has_power_nap = True
-                if delta <= 90:
-                    d1 = logs_chrono.iloc[i]["drink_id"]
-                    d2 = logs_chrono.iloc[i+1]["drink_id"]
-                    is_c1 = d1 in [1, 3]
-                    is_c2 = d2 in [1, 3]
-                    if (is_c1 and not is_c2) or (not is_c1 and is_c2):
-                        has_cursed_fusion = True
-            user_secrets["power_nap"] = has_power_nap
-            user_secrets["cursed_fusion"] = has_cursed_fusion
-            
-            has_overclock = False
-            for i in range(len(logs_chrono)):
-                window = logs_chrono[(times >= times.iloc[i]) & (times <= times.iloc[i] + pd.Timedelta(hours=2))]
-                if len(window) >= 4:
-                    has_overclock = True
-                    break
-            user_secrets["overclock"] = has_overclock
-            
-            max_mono = 0
-            if len(logs_chrono) > 0:
-                cur_m = 1
-                max_mono = 1
-                d_list = logs_chrono["drink_id"].tolist()
-                for i in range(1, len(d_list)):
-                    if d_list[i] == d_list[i-1]:
-                        cur_m += 1
-                        if cur_m > max_mono:
-                            max_mono = cur_m
-                    else:
-                        cur_m = 1
-            user_secrets["monastic"] = bool(max_mono >= 35)
-            
-            user_secrets["high_noon"] = bool(((logs_chrono["hour"] == 12) & (times.dt.minute <= 5)).any())
-            
-            has_all_nighter = False
-            user_dates = sorted(list(set(logs_chrono["date_only"])))
-            for d in user_dates:
-                next_d = d + pd.Timedelta(days=1)
-                late = logs_chrono[(logs_chrono["date_only"] == d) & (logs_chrono["hour"] >= 23)]
-                early = logs_chrono[(logs_chrono["date_only"] == next_d) & (logs_chrono["hour"] < 6)]
-                if not late.empty and not early.empty:
-                    has_all_nighter = True
-                    break
-            user_secrets["all_nighter"] = has_all_nighter
-            
-            distinct_drinks = set(logs_chrono["drink_id"].unique())
-            user_secrets["alchemist"] = bool({1, 2, 3, 4}.issubset(distinct_drinks))
-            
-            has_thermal = False
-            if len(logs_chrono) >= 3:
-                d_list = logs_chrono["drink_id"].tolist()
-                for i in range(len(d_list) - 2):
-                    is_iced1 = d_list[i] in [3, 4]
-                    is_hot2 = d_list[i+1] in [1, 2]
-                    is_iced3 = d_list[i+2] in [3, 4]
-                    if is_iced1 and is_hot2 and is_iced3:
-                        has_thermal = True
-                        break
-            user_secrets["thermal_sandwich"] = has_thermal
-        else:
-            for s_id in ["phantom", "clockwork", "power_nap", "cursed_fusion", "overclock", "monastic", "high_noon", "all_nighter", "alchemist", "thermal_sandwich"]:
-                user_secrets[s_id] = False
-                
+        user_secrets = {s_id: bool(ach_feats.at[user, s_id]) for s_id in ACTIVITY_SECRETS}
+
         # Theme unlocks check from transactions
         from data_processing import get_unlocked_themes, ALL_VALID_THEMES
         unlocked_set = set(get_unlocked_themes(transactions or [], user))
         user_secrets["chromatic_sovereign"] = bool(len(unlocked_set) >= len(ALL_VALID_THEMES))
         
         # Passport Travel Secrets (strictly evaluated from post-release logs)
-        if not user_logs.empty and passport:
-            user_secrets["continent_hopper"] = len(passport.get("continents_visited", set())) >= 3
-            user_secrets["jet_lagged"] = passport.get("jet_lagged", False)
-            user_secrets["homebody"] = passport.get("max_home_streak", 0) >= 100
-            user_secrets["capital_tour"] = len(passport.get("capital_cities_visited", set())) >= 3
-            user_secrets["twin_cities"] = any(len(cities) >= 2 for cities in passport.get("country_cities_map", {}).values())
-            
-            coffee_caps_count = sum(passport.get("city_counts", {}).get(k, 0) for k in passport.get("city_counts", {}) if is_coffee_capital(k[1]))
-            user_secrets["coffee_capital"] = bool(len(passport.get("coffee_capitals_visited", set())) >= 2 or coffee_caps_count >= 3)
-            user_secrets["mile_high"] = bool(passport.get("in_flight_drinks", 0) >= 1)
-        else:
-            user_secrets["continent_hopper"] = False
-            user_secrets["jet_lagged"] = False
-            user_secrets["homebody"] = False
-            user_secrets["capital_tour"] = False
-            user_secrets["twin_cities"] = False
-            user_secrets["coffee_capital"] = False
-            user_secrets["mile_high"] = False
+        user_secrets.update(passport_secrets(passport if not user_logs.empty else {}))
             
         user_secrets["ui_2_0_pioneer"] = bool(not user_logs.empty)
 
@@ -0,0 +1,57 @@
+import pandas as pd
+from drinks import DRINK_TABLE, COFFEE_IDS, TEA_IDS, ICED_IDS
+
+# Shared event features: the engine and the Hall of Fame read their per-log and per-day
+# numbers from these two frames instead of re-deriving hours, days and caffeine each.
+
+DAILY_FEATURE_COLUMNS = ["logs", "coffee_logs", "tea_logs", "drinks", "coffee", "tea", "iced", "caffeine_mg", "early", "night"]
+
+def localized_events(combined):
+    """
+    The crew's logs sorted by user and time, with the Madrid-local fields the per-user
+    statistics read: local time, calendar day, hour, weekday and caffeine (from the drink catalog).
+    """
+    events = combined.sort_values(["user_name", "created_at"], kind="stable")
+    if "created_at_local" in events.columns:
+        local = events["created_at_local"]
+    else:
+        created = events["created_at"] if events["created_at"].dt.tz is not None else events["created_at"].dt.tz_localize("UTC")
+        local = created.dt.tz_convert("Europe/Madrid")
+    mg = events["drink_id"].astype("int64").map(DRINK_TABLE["mg"]).fillna(0).astype("int64")
+    return events.assign(
+        local_dt=local,
+        day=local.dt.tz_localize(None).dt.normalize(),
+        hour=local.dt.hour,
+        dayofweek=local.dt.dayofweek,
+        caffeine_mg=mg * events["value"]
+    )
+
+def daily_features(events):
+    """
+    One row per (user_name, local day) with logs of `events` (from localized_events): log counts,
+    drinks by category and temperature, caffeine, and the early (< 9h) / night (>= 19h) drinks.
+    """
+    if events.empty:
+        index = pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([])], names=["user_name", "day"])
+        return pd.DataFrame(0, index=index, columns=DAILY_FEATURE_COLUMNS)
+    value = events["value"]
+    drink = events["drink_id"]
+    is_coffee = drink.isin(COFFEE_IDS)
+    is_tea = drink.isin(TEA_IDS)
+    per_row = pd.DataFrame({
+        "user_name": events["user_name"],
+        "day": events["day"],
+        "coffee_logs": is_coffee,
+        "tea_logs": is_tea,
+        "drinks": value,
+        "coffee": value.where(is_coffee, 0),
+        "tea": value.where(is_tea, 0),
+        "iced": value.where(drink.isin(ICED_IDS), 0),
+        "caffeine_mg": events["caffeine_mg"],
+        "early": value.where(events["hour"] < 9, 0),
+        "night": value.where(events["hour"] >= 19, 0)
+    })
+    grouped = per_row.groupby(["user_name", "day"], observed=True)
+    daily = grouped.sum()
+    daily.insert(0, "logs", grouped.size())
+    return daily[DAILY_FEATURE_COLUMNS].astype("int64")
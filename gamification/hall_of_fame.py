@@ -1,7 +1,10 @@
 import streamlit as st
 import pandas as pd
+from dataset_keys import DATASET_HASH_FUNCS
+from gamification.streaks import user_streaks
+from gamification.features import localized_events, daily_features
 
-@st.cache_data(show_spinner=False)
+@st.cache_data(show_spinner=False, hash_funcs=DATASET_HASH_FUNCS)
 def compute_monarch_hall_of_fame(df_coffee, df_tea, users, transactions=None):
     """
     Computes complete dynasty lineage and Hall of Fame for the 4 global monarch thrones:
@@ -16,7 +19,7 @@ def compute_monarch_hall_of_fame(df_coffee, df_tea, users, transactions=None):
     if not df_coffee.empty:
         df_c = df_coffee.copy()
         df_c["week_str"] = df_c["created_at"].dt.strftime("%Y-W%W")
-        weekly_groups = df_c.groupby(["week_str", "user_name"])["value"].sum().unstack(fill_value=0)
+        weekly_groups = df_c.groupby(["week_str", "user_name"], observed=True)["value"].sum().unstack(fill_value=0)
         
         user_weekly_wins = {u: 0 for u in users}
         user_last_reign_date = {u: None for u in users}
@@ -35,7 +38,7 @@ def compute_monarch_hall_of_fame(df_coffee, df_tea, users, transactions=None):
                 
         seven_days_ago = pd.Timestamp.now(tz=df_c["created_at"].dt.tz) - pd.Timedelta(days=7)
         recent_c = df_c[df_c["created_at"] >= seven_days_ago]
-        cur_caff_holder = recent_c.groupby("user_name")["value"].sum().idxmax() if not recent_c.empty else None
+        cur_caff_holder = recent_c.groupby("user_name", observed=True)["value"].sum().idxmax() if not recent_c.empty else None
 
         for u in users:
             if user_weekly_wins[u] > 0 or user_peak_weekly[u] > 0:
@@ -92,7 +95,7 @@ def compute_monarch_hall_of_fame(df_coffee, df_tea, users, transactions=None):
     if not combined.empty and "drink_id" in combined.columns:
         iced_logs = combined[combined["drink_id"].isin([3, 4])]
         if not iced_logs.empty:
-            ice_counts = iced_logs.groupby("user_name")["value"].sum().to_dict()
+            ice_counts = iced_logs.groupby("user_name", observed=True)["value"].sum().to_dict()
             top_ice_user = max(ice_counts, key=ice_counts.get) if ice_counts else None
             for u in users:
                 u_ice_logs = iced_logs[iced_logs["user_name"] == u]
@@ -113,20 +116,12 @@ def compute_monarch_hall_of_fame(df_coffee, df_tea, users, transactions=None):
     # 4. Combustion Monarch (Warp Speed / 400+ mg Days)
     combustion_hof = []
     if not combined.empty:
-        caff_map = {1: 95, 3: 95, 2: 35, 4: 35}
-        comb_copy = combined.copy()
-        comb_copy["caff_mg"] = comb_copy["drink_id"].map(caff_map).fillna(50)
-        if comb_copy["created_at"].dt.tz is None:
-            comb_copy["created_at"] = comb_copy["created_at"].dt.tz_localize("UTC")
-        comb_copy["madrid_dt"] = comb_copy["created_at"].dt.tz_convert("Europe/Madrid")
-        comb_copy["date"] = comb_copy["madrid_dt"].dt.date
-        
-        daily_caff = comb_copy.groupby(["user_name", "date"])["caff_mg"].sum().reset_index()
-        on_fire_days = daily_caff[daily_caff["caff_mg"] >= 400]
+        daily_caff = daily_features(localized_events(combined))["caffeine_mg"].reset_index()
+        on_fire_days = daily_caff[daily_caff["caffeine_mg"] >= 400].rename(columns={"day": "date"})
         
         top_fire_user = None
         if not on_fire_days.empty:
-            fire_counts = on_fire_days.groupby("user_name")["date"].count().to_dict()
+            fire_counts = on_fire_days.groupby("user_name", observed=True)["date"].count().to_dict()
             top_fire_user = max(fire_counts, key=fire_counts.get) if fire_counts else None
         else:
             fire_counts = {}
@@ -177,7 +172,7 @@ def compute_monarch_hall_of_fame(df_coffee, df_tea, users, transactions=None):
         }
     }
 
-@st.cache_data(show_spinner=False)
+@st.cache_data(show_spinner=False, hash_funcs=DATASET_HASH_FUNCS)
 def compute_all_trophy_hall_of_fames(df_coffee, df_tea, users, transactions=None):
     """Computes full crew breakdowns and rankings across all milestone and style trophies."""
     combined = pd.concat([df_coffee, df_tea]) if not df_coffee.empty or not df_tea.empty else pd.DataFrame()
@@ -197,53 +192,25 @@ def compute_all_trophy_hall_of_fames(df_coffee, df_tea, users, transactions=None
     res = {}
     
     # 1. Streak Sovereign
-    streak_records = []
-    for u in users:
-        u_logs = combined[combined["user_name"] == u].copy() if not combined.empty else pd.DataFrame()
-        best_streak = 0
-        current_streak = 0
-        if not u_logs.empty:
-            dates_asc = u_logs["local_dt"].dt.normalize().drop_duplicates().sort_values().tolist()
-            if dates_asc:
-                cur_len = 1
-                best_streak = 1
-                for i in range(1, len(dates_asc)):
-                    if dates_asc[i] - dates_asc[i-1] == pd.Timedelta(days=1):
-                        cur_len += 1
-                        if cur_len > best_streak:
-                            best_streak = cur_len
-                    else:
-                        cur_len = 1
-            
-            dates_desc = u_logs["local_dt"].dt.normalize().drop_duplicates().sort_values(ascending=False).tolist()
-            if dates_desc:
-                today = pd.Timestamp.now(tz=dates_desc[0].tz).normalize()
-                if dates_desc[0] >= today - pd.Timedelta(days=1):
-                    cur_s = 1
-                    for i in range(1, len(dates_desc)):
-                        if dates_desc[i-1] - dates_desc[i] == pd.Timedelta(days=1):
-                            cur_s += 1
-                        else:
-                            break
-                    current_streak = cur_s
-        streak_records.append({"user": u, "best_streak": best_streak, "current_streak": current_streak})
+    if not combined.empty:
+        streaks = user_streaks(combined["user_name"], combined["local_dt"].dt.tz_localize(None).dt.normalize(), users)
+    else:
+        streaks = user_streaks([], [], users)
+    streak_records = [
+        {"user": u, "best_streak": int(streaks.at[u, "best"]), "current_streak": int(streaks.at[u, "current"])}
+        for u in users
+    ]
     streak_records.sort(key=lambda x: x["best_streak"], reverse=True)
     res["streak_sovereign"] = streak_records
 
     # 2. Velocity Monarch (Most Coffees in a Single Day)
     velocity_records = []
     if not df_coffee.empty:
-        df_c = df_coffee.copy()
-        if df_c["created_at"].dt.tz is None:
-            df_c["created_at"] = df_c["created_at"].dt.tz_localize("UTC")
-        df_c["local_date"] = df_c["created_at"].dt.tz_convert("Europe/Madrid").dt.date
+        daily_coffees = daily_features(localized_events(combined))["coffee"]
         for u in users:
-            u_c = df_c[df_c["user_name"] == u]
-            if not u_c.empty:
-                daily = u_c.groupby("local_date")["value"].sum()
-                max_val = int(daily.max())
-                best_date = str(daily.idxmax())
-                velocity_records.append({"user": u, "max_day": max_val, "best_date": best_date})
+            u_daily = daily_coffees.xs(u, level="user_name") if u in daily_coffees.index.get_level_values("user_name") else pd.Series(dtype="int64")
+            if u_daily.max() > 0:
+                velocity_records.append({"user": u, "max_day": int(u_daily.max()), "best_date": u_daily.idxmax().strftime("%Y-%m-%d")})
             else:
                 velocity_records.append({"user": u, "max_day": 0, "best_date": "-"})
     velocity_records.sort(key=lambda x: x["max_day"], reverse=True)
@@ -0,0 +1,346 @@
+import copy
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+import streamlit as st
+from dataset_keys import registered_key
+from drinks import DRINK_CATALOG, COFFEE_IDS, ICED_IDS, HOT_IDS, caffeine_mg
+from world_data import TRAVEL_COUNTRIES, normalize_city_name, get_cities_for_country, is_capital_city, is_coffee_capital
+from gamification.achievements import ACHIEVEMENTS_START_DATE
+from gamification.engine import ACTIVITY_SECRETS, build_achievement_tracks, passport_secrets
+
+# Running (fold one event at a time) version of the per-user parts of get_gamification_metrics:
+# counters, streaks, same-drink runs, the current local day's totals and the last few logs are all
+# a user needs to carry, so a new tap costs O(1) however long the history is.
+
+LOCAL_TZ = "Europe/Madrid"
+
+class _Running:
+    """Streak and daily thresholds of one user, folded in time order (calendar days of LOCAL_TZ)."""
+    def __init__(self):
+        self.last_day = None
+        self.run = 0
+        self.best = 0
+        self.active_days = 0
+        self.day_drinks = 0
+        self.day_caffeine = 0
+        self.surge = 0
+        self.combustion = 0
+
+    def add(self, day, drinks, caffeine):
+        if day != self.last_day:
+            self.run = self.run + 1 if self.last_day is not None and (day - self.last_day).days == 1 else 1
+            self.best = max(self.best, self.run)
+            self.last_day = day
+            self.active_days += 1
+            self.day_drinks = 0
+            self.day_caffeine = 0
+        # A threshold day counts once, when the day's running total first reaches it
+        self.surge += int(self.day_drinks < 3 <= self.day_drinks + drinks)
+        self.combustion += int(self.day_caffeine < 400 <= self.day_caffeine + caffeine)
+        self.day_drinks += drinks
+        self.day_caffeine += caffeine
+
+    def current_streak(self, today):
+        if self.last_day is None or (today - self.last_day).days > 1:
+            return 0
+        return self.run
+
+class UserProgress:
+    """Everything the tiers, feats and crowns read about one user's logs, updated per log."""
+    def __init__(self):
+        self.logs = 0
+        self.coffee_logs = self.tea_logs = 0
+        self.coffee = self.tea = self.iced = 0
+        self.early = self.night = self.weekend = 0
+        self.days = _Running()
+        self.feats = {s_id: False for s_id in ACTIVITY_SECRETS}
+        self.last_time = None
+        self.recent_times = deque(maxlen=3)
+        self.recent_drinks = deque(maxlen=2)
+        self.mono_run = 0
+        self.mono_best = 0
+        self.last_late_day = None
+        self.drink_kinds = set()
+        self.passport = {
+            "countries_visited": set(),
+            "continents_reached": set(),
+            "cities_visited": set(),
+            "in_flight_drinks": 0,
+            "city_counts": {},
+            "country_cities_map": {},
+            "capital_cities_visited": set(),
+            "coffee_capitals_visited": set()
+        }
+
+    def fold(self, created_at, local, drink_id, value, country=None, city=None):
+        """Adds one log; returns False (and changes nothing) if it predates the user's latest log."""
+        if self.last_time is not None and created_at < self.last_time:
+            return False
+        is_coffee = drink_id in COFFEE_IDS
+        is_iced = drink_id in ICED_IDS
+        day = local.date()
+        hour = local.hour
+
+        # 1. Counters
+        self.logs += 1
+        self.coffee_logs += int(is_coffee)
+        self.tea_logs += int(not is_coffee)
+        self.coffee += value if is_coffee else 0
+        self.tea += 0 if is_coffee else value
+        self.iced += value if is_iced else 0
+        self.early += value if hour < 9 else 0
+        self.night += value if hour >= 19 else 0
+        self.weekend += value if local.dayofweek in [5, 6] else 0
+        self.days.add(day, value, caffeine_mg(drink_id, value))
+
+        # 2. Secret feats against the previous logs
+        feats = self.feats
+        feats["phantom"] |= hour == 3
+        feats["clockwork"] |= local.minute == 0
+        feats["high_noon"] |= hour == 12 and local.minute <= 5
+        if self.last_time is not None:
+            gap = (created_at - self.last_time).total_seconds()
+            feats["power_nap"] |= 18 * 60 <= gap <= 25 * 60
+            feats["cursed_fusion"] |= gap <= 90 and (self.recent_drinks[-1] in COFFEE_IDS) != is_coffee
+        if len(self.recent_times) == 3:
+            feats["overclock"] |= created_at - self.recent_times[0] <= pd.Timedelta(hours=2)
+        if len(self.recent_drinks) == 2:
+            feats["thermal_sandwich"] |= self.recent_drinks[0] in ICED_IDS and self.recent_drinks[1] in HOT_IDS and is_iced
+        if hour < 6 and self.last_late_day is not None and (day - self.last_late_day).days == 1:
+            feats["all_nighter"] = True
+        if hour >= 23:
+            self.last_late_day = day
+        self.mono_run = self.mono_run + 1 if self.recent_drinks and self.recent_drinks[-1] == drink_id else 1
+        self.mono_best = max(self.mono_best, self.mono_run)
+        feats["monastic"] = self.mono_best >= 35
+        self.drink_kinds.add(drink_id)
+        feats["alchemist"] = set(DRINK_CATALOG).issubset(self.drink_kinds)
+
+        self.last_time = created_at
+        self.recent_times.append(created_at)
+        self.recent_drinks.append(drink_id)
+        self._fold_location(country, city)
+        return True
+
+    def _fold_location(self, country, city):
+        # Same rules as world_data.compute_passport_stats for a single click
+        if not country:
+            return
+        passport = self.passport
+        if str(country).upper() in ["PLANE", "FLIGHT", "TRANSIT"]:
+            passport["in_flight_drinks"] += 1
+            return
+        if country not in TRAVEL_COUNTRIES:
+            return
+        norm_city = normalize_city_name(city or get_cities_for_country(country)[0])
+        passport["countries_visited"].add(country)
+        passport["continents_reached"].add(TRAVEL_COUNTRIES[country]["continent"])
+        if norm_city:
+            city_key = (country, norm_city)
+            passport["cities_visited"].add(city_key)
+            passport["city_counts"][city_key] = passport["city_counts"].get(city_key, 0) + 1
+            passport["country_cities_map"].setdefault(country, set()).add(norm_city)
+            if is_capital_city(country, norm_city):
+                passport["capital_cities_visited"].add(city_key)
+            if is_coffee_capital(norm_city):
+                passport["coffee_capitals_visited"].add(norm_city)
+
+    def stats_map(self):
+        """The achievement track values, as get_gamification_metrics builds them."""
+        return {
+            "total": self.coffee + self.tea,
+            "coffee": self.coffee,
+            "tea": self.tea,
+            "iced": self.iced,
+            "streak": self.days.best,
+            "active_days": self.days.active_days,
+            "early": self.early,
+            "night": self.night,
+            "surge": self.days.surge,
+            "weekend": self.weekend,
+            "combustion": self.days.combustion,
+            "world_explorer": len(self.passport["countries_visited"]),
+            "metropolis_explorer": len(self.passport["cities_visited"])
+        }
+
+    def secrets(self):
+        """The secret feats decided by the logs (all but the theme-based chromatic_sovereign)."""
+        user_secrets = {s_id: bool(self.feats[s_id]) for s_id in ACTIVITY_SECRETS}
+        user_secrets.update(passport_secrets(self.passport if self.logs else {}))
+        user_secrets["ui_2_0_pioneer"] = bool(self.logs)
+        return user_secrets
+
+class CrewProgress:
+    """
+    Running gamification state of the whole crew: all-time and post-release UserProgress per user
+    plus the last week of coffees (Caffeine Monarch). fold() takes one log in time order and
+    trophies() returns the per-user sections of get_gamification_metrics from the state alone.
+    """
+    def __init__(self, users, achievements_start_date=ACHIEVEMENTS_START_DATE):
+        self.users = list(users)
+        self.achievements_start_date = achievements_start_date
+        self.history = {}
+        self.season = {}
+        self.recent_coffees = deque()
+
+    @classmethod
+    def from_frame(cls, df, users, achievements_start_date=ACHIEVEMENTS_START_DATE):
+        """Folds every log of an event frame from process_raw_data, in time order."""
+        progress = cls(users, achievements_start_date)
+        if not df.empty:
+            progress.fold_frame(df.sort_values("created_at", kind="stable"))
+        return progress
+
+    def fold_frame(self, df):
+        """Folds the rows of an event frame in order; False if one predates its user's latest log."""
+        if df.empty:
+            return True
+        created = df["created_at"] if df["created_at"].dt.tz is not None else df["created_at"].dt.tz_localize("UTC")
+        local = df["created_at_local"] if "created_at_local" in df.columns else created.dt.tz_convert(LOCAL_TZ)
+        places = [
+            df[col].astype(object).where(df[col].notna(), None).tolist() if col in df.columns else [None] * len(df)
+            for col in ("country", "city")
+        ]
+        rows = zip(df["user_name"].astype(str).tolist(), created.tolist(), local.tolist(),
+                   df["drink_id"].astype(int).tolist(), df["value"].astype(int).tolist(), *places)
+        return all(self.fold(*row) for row in rows)
+
+    def fold_click(self, row):
+        """Folds a raw clicks row (e.g. WriteBatch.pending_rows("clicks")); False if out of order."""
+        created_at = pd.Timestamp(row.get("created_at") or pd.Timestamp.now(tz="UTC"))
+        created_at = created_at.tz_localize("UTC") if created_at.tz is None else created_at.tz_convert("UTC")
+        loc = row.get("location")
+        if isinstance(loc, dict) and loc.get("country"):
+            country, city = loc.get("country"), loc.get("city")
+        else:
+            country, city = row.get("country"), row.get("city")
+        value = row.get("value")
+        return self.fold(row.get("user_name"), created_at, created_at.tz_convert(LOCAL_TZ),
+                         int(row.get("drink_id") or 1), int(value) if value is not None else 1, country, city)
+
+    def fold(self, user, created_at, local, drink_id, value=1, country=None, city=None):
+        """Adds one log (UTC and local timestamps); False, with nothing changed, if out of time order."""
+        if drink_id not in DRINK_CATALOG:
+            return True
+        history = self.history.setdefault(user, UserProgress())
+        if history.last_time is not None and created_at < history.last_time:
+            return False
+        history.fold(created_at, local, drink_id, value, country, city)
+        if created_at >= self.achievements_start_date:
+            self.season.setdefault(user, UserProgress()).fold(created_at, local, drink_id, value, country, city)
+        if drink_id in COFFEE_IDS:
+            self.recent_coffees.append((created_at, user, value))
+            # Coffees older than a week are out of every window from now on
+            horizon = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=7)
+            while self.recent_coffees and self.recent_coffees[0][0] < horizon:
+                self.recent_coffees.popleft()
+        return True
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def season_progress(self, user):
+        """The user's post-release UserProgress (an empty one before their first post-release log)."""
+        return self.season.get(user) or UserProgress()
+
+    def crowns(self, now=None):
+        """
+        Current monarch holders as get_gamification_metrics reports them (ranked monarchs break ties
+        alphabetically among every logged name, per-crew ones in crew order).
+        """
+        now = now if now is not None else pd.Timestamp.now(tz="UTC")
+        empty = UserProgress()
+        history = {u: self.history.get(u, empty) for u in self.users}
+        crowns = {"caffeine_addict": None, "tea_purist": None, "ice_monarch": None, "combustion_monarch": None}
+        recent = {}
+        for created_at, user, value in self.recent_coffees:
+            if created_at >= now - pd.Timedelta(days=7):
+                recent[user] = recent.get(user, 0) + value
+        if recent:
+            crowns["caffeine_addict"] = max(sorted(recent), key=recent.get)
+        ratios = {u: p.tea_logs / (p.coffee_logs + 1) for u, p in history.items() if p.tea_logs > 0}
+        if ratios:
+            crowns["tea_purist"] = max(ratios, key=ratios.get)
+        iced = {u: p.iced for u, p in sorted(self.history.items()) if p.iced > 0}
+        if iced:
+            top_ice = max(iced, key=iced.get)
+            crowns["ice_monarch"] = {"user": top_ice, "count": int(iced[top_ice])}
+        fire = {u: p.days.combustion for u, p in history.items()}
+        if fire and max(fire.values()) > 0:
+            top_fire = max(fire, key=fire.get)
+            crowns["combustion_monarch"] = {"user": top_fire, "count": int(fire[top_fire])}
+        return crowns
+
+    def trophies(self, transactions=None, now=None):
+        """
+        The crowns, streaks, personal_achievements and secret_feats entries of get_gamification_metrics
+        (same values, same tie-breaking), for the logs folded so far.
+        """
+        from data_processing import get_unlocked_themes, ALL_VALID_THEMES
+        now = now if now is not None else pd.Timestamp.now(tz="UTC")
+        today = now.tz_convert(LOCAL_TZ).date()
+        empty = UserProgress()
+        history = {u: self.history.get(u, empty) for u in self.users}
+
+        # 1. Crowns
+        trophies = self.crowns(now)
+        trophies.update({"streaks": {}, "personal_achievements": {}, "secret_feats": {}})
+
+        # 2. Streaks
+        trophies["streaks"] = {u: p.days.current_streak(today) for u, p in history.items()}
+        best = {u: p.days.best for u, p in history.items()}
+        if best and max(best.values()) > 0:
+            top_streak = max(best, key=best.get)
+            trophies["longest_historical_streak"] = {"user": top_streak, "days": best[top_streak]}
+
+        # 3. Post-release tiers and secret feats
+        for user in self.users:
+            season = self.season_progress(user)
+            trophies["personal_achievements"][user] = build_achievement_tracks(season.stats_map())
+            user_secrets = season.secrets()
+            unlocked_set = set(get_unlocked_themes(transactions or [], user))
+            user_secrets["chromatic_sovereign"] = bool(len(unlocked_set) >= len(ALL_VALID_THEMES))
+            trophies["secret_feats"][user] = user_secrets
+        return trophies
+
+@st.cache_resource(show_spinner=False)
+def _get_progress_store() -> dict:
+    """Process-wide running crew states of the shared event frames, one per dataset, crew and release date."""
+    return {"entries": {}, "lock": threading.Lock()}
+
+def get_crew_progress(df, users, achievements_start_date=ACHIEVEMENTS_START_DATE) -> CrewProgress:
+    """
+    The crew's CrewProgress over every log of `df` (the full event frame from process_raw_data), as a
+    private copy the caller may fold new logs into. For the shared frame the state of the rows already
+    stored is kept across dataset versions and only newly synced rows are folded in; queued rows not
+    stored yet (no id, always last) are folded into the copy. Any other frame is folded from scratch.
+    """
+    key = registered_key(df)
+    if key is None or "id" not in df.columns or df.empty:
+        return CrewProgress.from_frame(df, users, achievements_start_date)
+    (source, table, (generation, _), columns), part = key
+    store = _get_progress_store()
+    with store["lock"]:
+        entry = store["entries"].setdefault(
+            (source, table, generation, columns, part, tuple(users), achievements_start_date),
+            {"rows": 0, "last_id": None, "progress": None, "lock": threading.Lock()}
+        )
+    with entry["lock"]:
+        stored = df["id"].notna().to_numpy()
+        n_stored = len(stored) - int(np.argmax(stored[::-1])) if stored.any() else 0
+        n_done = entry["rows"]
+        if entry["progress"] is None or n_done > n_stored or (n_done and df["id"].iloc[n_done - 1] != entry["last_id"]):
+            # First build, or the table was re-read from scratch
+            n_done = 0
+            entry["progress"] = CrewProgress(users, achievements_start_date)
+        if n_stored > n_done:
+            if not entry["progress"].fold_frame(df.iloc[n_done:n_stored]):
+                # A synced log predates its user's latest one: refold everything stored in time order
+                entry["progress"] = CrewProgress.from_frame(df.iloc[:n_stored], users, achievements_start_date)
+            entry["rows"], entry["last_id"] = n_stored, df["id"].iloc[n_stored - 1]
+        progress = entry["progress"].copy()
+    if n_stored < len(df) and not progress.fold_frame(df.iloc[n_stored:]):
+        progress = CrewProgress.from_frame(df, users, achievements_start_date)
+    return progress
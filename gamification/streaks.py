@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+def user_streaks(user_names, days, users, today=None):
+    """
+    Longest and current runs of consecutive days with at least one drink, for every user at once.
+    - user_names / days: aligned Series of each log's user and local calendar day (naive midnight)
+    - today: local calendar day the current streak must reach (or the day before); Madrid today by default
+    Returns a DataFrame indexed by `users` with integer "best" and "current" columns.
+    """
+    if today is None:
+        today = pd.Timestamp.now(tz="Europe/Madrid").tz_localize(None).normalize()
+    streaks = pd.DataFrame(0, index=pd.Index(users, name="user_name"), columns=["best", "current"])
+    if len(days) == 0:
+        return streaks
+
+    # Unique (user, day) pairs as int day ordinals, sorted; a run breaks on a new user or a gap > 1 day
+    pairs = pd.DataFrame({"user_name": pd.Series(user_names).astype(str).to_numpy(), "day": pd.Series(days).to_numpy("datetime64[D]").astype(np.int64)})
+    pairs = pairs.drop_duplicates().sort_values(["user_name", "day"])
+    user = pairs["user_name"].to_numpy()
+    day = pairs["day"].to_numpy()
+    continues = np.zeros(len(day), dtype=bool)
+    continues[1:] = (user[1:] == user[:-1]) & (day[1:] - day[:-1] == 1)
+    run = np.cumsum(~continues)
+
+    runs = pd.DataFrame({"user_name": user, "day": day, "run": run}).groupby("run").agg(
+        user_name=("user_name", "first"), last_day=("day", "max"), length=("day", "size")
+    )
+    best = runs.groupby("user_name")["length"].max()
+    # The latest run of each user is current if it ends today or yesterday
+    latest = runs.groupby("user_name").tail(1).set_index("user_name")
+    today_ordinal = np.datetime64(pd.Timestamp(today).normalize().date(), "D").astype(np.int64)
+    current = latest["length"].where(latest["last_day"] >= today_ordinal - 1, 0)
+
+    streaks["best"] = best.reindex(streaks.index, fill_value=0).astype(int)
+    streaks["current"] = current.reindex(streaks.index, fill_value=0).astype(int)
+    return streaks
@@ -15,6 +15,7 @@ from data_processing import (
     resolve_user_title
 )
 from utils import enforce_user_identity
+from drinks import COFFEE_MG, COFFEE_COST, TEA_MG, TEA_COST
 from world_data import TRAVEL_COUNTRIES, get_option_from_code, normalize_city_name, get_cities_for_country
 from components.ui import inject_custom_css, render_app_header
 from components.charts import (
@@ -90,16 +91,19 @@ with st.container(border=True):
 
 # Apply Drink Filter
 if drink_filter == "Coffee Only":
-    df_filtered = df_coffee.copy()
+    df_source = df_coffee
 elif drink_filter == "Tea Only":
-    df_filtered = df_tea.copy()
+    df_source = df_tea
 else:
-    df_filtered = df.copy()
+    df_source = df
+df_filtered = df_source.copy()
 
 # Add explicit drink labels for multi-line tracking
 if not df_filtered.empty and "drink_id" in df_filtered.columns:
     mask_coffee = df_filtered["drink_id"].isin([1, 3])
     mask_tea = df_filtered["drink_id"].isin([2, 4])
+    # user_name is categorical in the shared frame; the labels below are new values
+    df_filtered["user_name"] = df_filtered["user_name"].astype(str)
     df_filtered.loc[mask_coffee, "user_name"] = df_filtered.loc[mask_coffee, "user_name"] + " (coffee)"
     df_filtered.loc[mask_tea, "user_name"] = df_filtered.loc[mask_tea, "user_name"] + " (tea)"
 
@@ -130,8 +134,8 @@ else:
     c_count = int(df_filtered[df_filtered["drink_id"].isin([1, 3])]["value"].sum()) if "drink_id" in df_filtered.columns else 0
     t_count = int(df_filtered[df_filtered["drink_id"].isin([2, 4])]["value"].sum()) if "drink_id" in df_filtered.columns else 0
     
-    total_cost = (c_count * 2.50) + (t_count * 1.50)
-    total_caffeine = (c_count * 95) + (t_count * 35)
+    total_cost = (c_count * COFFEE_COST) + (t_count * TEA_COST)
+    total_caffeine = (c_count * COFFEE_MG) + (t_count * TEA_MG)
     
     busiest_day = df_filtered["created_at"].dt.day_name().value_counts().idxmax()
     peak_hour = int(df_filtered["created_at"].dt.hour.value_counts().idxmax())
@@ -192,7 +196,7 @@ def render_rhythm_tab(df_filtered):
         plot_average_weekday_distribution(df_filtered, title="Average Drinks per Weekday", mode=calc_mode)
 
 @fragment_dec
-def render_projections_tab(df_all_dates, chart_users, now):
+def render_projections_tab(df_all_dates, df_source, chart_users, now):
     with st.container(border=True):
         st.markdown("#### 🚀 Predictive Trend Extrapolation")
         p_time = st.segmented_control("Forecast Horizon", ["This Week", "This Month", "This Year"], default="This Month")
@@ -218,7 +222,7 @@ def render_projections_tab(df_all_dates, chart_users, now):
         if df_proj.empty:
             st.info("Not enough data in this period to calculate a forecast.")
         else:
-            projected_values = plot_cumulative_projections(df_proj, p_start, p_end, chart_users, title=f"Forecast to end of {p_time}")
+            projected_values = plot_cumulative_projections(df_source, p_start, p_end, chart_users, title=f"Forecast to end of {p_time}", label_drinks=True)
             
             if projected_values:
                 st.markdown(f"**Predicted Total Drinks by end of {p_time}:**")
@@ -244,7 +248,7 @@ if not df_filtered.empty:
         with c_col1:
             with st.container(border=True):
                 st.markdown("#### 🍩 Beverage Volume Share")
-                pie_scores = df_filtered.groupby("user_name")["value"].sum().to_dict()
+                pie_scores = df_filtered.groupby("user_name", observed=True)["value"].sum().to_dict()
                 render_pie_chart(pie_scores, "User", "Total Drinks", is_coffee=(drink_filter == "Coffee Only"))
         with c_col2:
             with st.container(border=True):
@@ -258,7 +262,7 @@ if not df_filtered.empty:
                     c_start = start_date.floor("D")
                 c_end = now.ceil("D")
                 
-                trend_df = get_cumulative_data(df_filtered, c_start, c_end, chart_users, "D")
+                trend_df = get_cumulative_data(df_source, c_start, c_end, chart_users, "D", label_drinks=True)
                 trend_title = f"Pace Trajectory ({date_filter})"
                 plot_metric(trend_df, trend_title)
 
@@ -293,7 +297,7 @@ if not df_filtered.empty:
 
     # --- TAB 4: Projections & Milestones ---
     with tab4:
-        render_projections_tab(df_all_dates, chart_users, now)
+        render_projections_tab(df_all_dates, df_source, chart_users, now)
 
     # --- TAB 5: Travel & Geography ---
     with tab5:
@@ -357,7 +361,7 @@ if not df_filtered.empty:
                     st.dataframe(continent_counts, use_container_width=True, hide_index=True)
 
     st.divider()
-    st.caption("*Estimated cost and caffeine assumptions: Coffee (€2.50, 95mg), Tea (€1.50, 35mg).*")
+    st.caption(f"*Estimated cost and caffeine assumptions: Coffee (€{COFFEE_COST:.2f}, {COFFEE_MG}mg), Tea (€{TEA_COST:.2f}, {TEA_MG}mg).*")
     
     with st.expander("🔍 View Raw Log Data"):
         st.dataframe(df_filtered, use_container_width=True)
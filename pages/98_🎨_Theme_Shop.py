@@ -5,8 +5,8 @@ import altair as alt
 import datetime
 import time
 
-from database import get_data, get_transactions, insert_transaction, get_preferences, save_user_preference
-from data_processing import process_raw_data, get_coin_balances, get_user_preferences, get_unlocked_themes
+from database import get_transactions, insert_transaction, get_preferences, save_user_preference, get_click_totals, get_transaction_totals
+from data_processing import get_coin_balances_from_totals, get_user_preferences, get_unlocked_themes
 from utils import verify_pin, is_pin_verified, enforce_user_identity
 from components.ui import inject_custom_css, ALL_THEMES, ALL_STYLES, THEME_METADATA
 
@@ -15,16 +15,16 @@ st.set_page_config(page_title="Theme Boutique & Studio", page_icon="🎨", layou
 users = ["Cris", "Bea", "Fer"]
 selected_user = enforce_user_identity(users)
 
-data = get_data()
-transactions = get_transactions()
+# Only the columns preferences and theme unlocks read (skips ids, timestamps and amounts)
+transactions = get_transactions(["user_name", "transaction_type", "metadata"])
 db_prefs = get_preferences()
 
 prefs = get_user_preferences(transactions, users, db_preferences=db_prefs)
 user_theme = prefs.get(selected_user, {}).get("theme", "Latte (Light)")
 user_style = prefs.get(selected_user, {}).get("ui_style", "Modern Flat")
 
-df, _, _, _, _ = process_raw_data(data, users)
-coin_balances = get_coin_balances(df, transactions, users)
+# Balances only need per-user totals, so the clicks history is never materialized here
+coin_balances = get_coin_balances_from_totals(get_click_totals(), get_transaction_totals(), users)
 balance = coin_balances.get(selected_user, 0)
 unlocked_themes = get_unlocked_themes(transactions, selected_user)
 
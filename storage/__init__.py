@@ -0,0 +1,16 @@
+from storage.base import StorageBackend
+from storage.supabase_backend import SupabaseBackend
+from storage.sqlite_backend import SQLiteBackend, SQLITE_SCHEMA
+from storage.write_queue import WriteQueue
+from storage.resilience import ResilientBackend, ResilientCaller, CircuitOpenError
+
+__all__ = [
+    "StorageBackend",
+    "SupabaseBackend",
+    "SQLiteBackend",
+    "SQLITE_SCHEMA",
+    "WriteQueue",
+    "ResilientBackend",
+    "ResilientCaller",
+    "CircuitOpenError"
+]
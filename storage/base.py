@@ -0,0 +1,59 @@
+class StorageBackend:
+    """
+    Interface for the tables behind database.py (clicks, coin_transactions, user_preferences).
+    Rows are plain dicts with the Supabase column names; JSON columns are dicts.
+    """
+    # Stable identifier of the data source (used to key local mirrors)
+    key = "backend"
+    # Whether data outlives the process (throwaway backends are not mirrored to disk)
+    persistent = True
+
+    def fetch_rows(self, table: str, since=None, offset: int = 0, limit: int = 1000, columns: list = None) -> list:
+        """
+        Returns a page of rows ordered by (created_at, id), optionally only those created at or after `since`.
+        `columns` restricts the row dicts to those columns (all columns when None).
+        """
+        raise NotImplementedError
+
+    def count_rows(self, table: str, since=None) -> int:
+        """Returns how many rows fetch_rows would page through for the same `since`."""
+        raise NotImplementedError
+
+    def select_where(self, table: str, filters: dict) -> list:
+        """Returns all rows whose columns equal the given values."""
+        raise NotImplementedError
+
+    def insert_rows(self, table: str, rows: list) -> list:
+        """Inserts rows and returns them as stored (with id and created_at filled in)."""
+        raise NotImplementedError
+
+    def update_rows(self, table: str, values: dict, filters: dict) -> list:
+        """Updates the rows matching `filters` and returns them as stored."""
+        raise NotImplementedError
+
+    def upsert_preferences(self, prefs: list) -> list:
+        """
+        Upserts user_preferences rows in one atomic statement per row and a single round trip.
+        Each item has `user_name`, any settings columns to overwrite and a `metadata` patch that is
+        merged key by key into the stored metadata (other keys are kept). Returns the stored rows.
+        """
+        raise NotImplementedError
+
+    def aggregate_clicks(self) -> list:
+        """Returns one row per (user_name, drink_id) with `clicks` (row count) and `value` (sum of value)."""
+        raise NotImplementedError
+
+    def aggregate_transactions(self) -> list:
+        """Returns one row per (user_name, transaction_type) with `transactions` (row count) and `amount` (sum of amount)."""
+        raise NotImplementedError
+
+    def has_columns(self, table: str, columns: list) -> bool:
+        """Returns whether every given column exists on the table."""
+        raise NotImplementedError
+
+    def watch(self, tables: list, on_change) -> None:
+        """
+        Starts a background change feed that calls on_change(table, rows) with rows inserted
+        (or updated) in the given tables from now on. Raises when the feed cannot be started.
+        """
+        raise NotImplementedError
@@ -0,0 +1,131 @@
+import random
+import sqlite3
+import threading
+import time
+from storage.base import StorageBackend
+
+class CircuitOpenError(ConnectionError):
+    """Raised without calling the backend while the circuit breaker is open."""
+
+try:
+    from httpx import NetworkError, TimeoutException, RemoteProtocolError
+    _TRANSPORT_ERRORS = (NetworkError, TimeoutException, RemoteProtocolError)
+except ImportError:
+    _TRANSPORT_ERRORS = ()
+
+# Server answers that still mean "unavailable right now": PostgREST PGRST000-002 (database unreachable),
+# SQLSTATE 08 connection, 53 resources, 57P shutdown, and gateway errors without a JSON body (502-504)
+_TRANSIENT_CODE_PREFIXES = ("PGRST00", "08", "53", "57P", "502", "503", "504")
+
+def is_transient(error: Exception) -> bool:
+    """
+    Whether retrying may help: connection failures, timeouts and locked/busy databases.
+    Everything else (rejected queries, constraint violations, bugs) is final.
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, sqlite3.OperationalError):
+        return "locked" in str(error) or "busy" in str(error)
+    if isinstance(error, (ConnectionError, TimeoutError) + _TRANSPORT_ERRORS):
+        return True
+    code = getattr(error, "code", None)
+    return code is not None and str(code).startswith(_TRANSIENT_CODE_PREFIXES)
+
+class ResilientCaller:
+    """
+    Retry and circuit-breaker policy shared by every backend call of a process.
+    Transient failures are retried with jittered exponential backoff; after `failure_threshold`
+    consecutive calls fail for good, the circuit opens and calls fail fast with CircuitOpenError
+    for `cooldown` seconds, after which one trial call is let through.
+    Per-attempt timeouts are set on the backend's own connections (HTTP client, SQLite busy timeout).
+    """
+
+    def __init__(self, retries: int = 3, base_delay: float = 0.25, max_delay: float = 2.0,
+                 failure_threshold: int = 5, cooldown: float = 30.0):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.cooldown
+
+    def call(self, fn, *args, retry: bool = True, **kwargs):
+        """Runs fn(*args, **kwargs) under the policy. Writes pass retry=False (not idempotent)."""
+        if self.is_open:
+            raise CircuitOpenError("Backend circuit is open after repeated failures")
+        attempts = self.retries if retry else 1
+        for attempt in range(attempts):
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # Not an availability problem (the request itself was rejected): raise at once, the backend is up
+                    self._record(success=True)
+                    raise
+                if attempt + 1 < attempts:
+                    time.sleep(min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0))
+                    continue
+                self._record(success=False)
+                raise
+            self._record(success=True)
+            return result
+
+    def _record(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+
+
+class ResilientBackend(StorageBackend):
+    """
+    Wraps a backend so every call goes through a ResilientCaller. Reads and idempotent writes
+    (update, upsert) are retried; plain inserts are not, since a timed-out insert may have landed.
+    """
+
+    def __init__(self, backend: StorageBackend, caller: ResilientCaller = None):
+        self.backend = backend
+        self.caller = caller or ResilientCaller()
+        self.key = backend.key
+        self.persistent = backend.persistent
+
+    def fetch_rows(self, table: str, since=None, offset: int = 0, limit: int = 1000, columns: list = None) -> list:
+        return self.caller.call(self.backend.fetch_rows, table, since=since, offset=offset, limit=limit, columns=columns)
+
+    def count_rows(self, table: str, since=None) -> int:
+        return self.caller.call(self.backend.count_rows, table, since=since)
+
+    def select_where(self, table: str, filters: dict) -> list:
+        return self.caller.call(self.backend.select_where, table, filters)
+
+    def insert_rows(self, table: str, rows: list) -> list:
+        return self.caller.call(self.backend.insert_rows, table, rows, retry=False)
+
+    def update_rows(self, table: str, values: dict, filters: dict) -> list:
+        return self.caller.call(self.backend.update_rows, table, values, filters)
+
+    def upsert_preferences(self, prefs: list) -> list:
+        return self.caller.call(self.backend.upsert_preferences, prefs)
+
+    def aggregate_clicks(self) -> list:
+        return self.caller.call(self.backend.aggregate_clicks)
+
+    def aggregate_transactions(self) -> list:
+        return self.caller.call(self.backend.aggregate_transactions)
+
+    def has_columns(self, table: str, columns: list) -> bool:
+        return self.caller.call(self.backend.has_columns, table, columns)
+
+    def watch(self, tables: list, on_change) -> None:
+        return self.backend.watch(tables, on_change)
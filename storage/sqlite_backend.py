@@ -0,0 +1,205 @@
+import json
+import sqlite3
+import threading
+import time
+import pandas as pd
+from storage.base import StorageBackend
+
+# Same tables and columns as the Supabase project (JSONB columns are stored as JSON text)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS clicks (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at  TEXT NOT NULL,
+    user_name   TEXT NOT NULL,
+    value       INTEGER NOT NULL DEFAULT 1,
+    drink_id    INTEGER,
+    location    TEXT,
+    country     TEXT,
+    city        TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_clicks_created ON clicks(created_at, id);
+
+CREATE TABLE IF NOT EXISTS coin_transactions (
+    id               INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at       TEXT NOT NULL,
+    user_name        TEXT NOT NULL,
+    amount           INTEGER NOT NULL DEFAULT 0,
+    transaction_type TEXT,
+    metadata         TEXT DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_tx_created ON coin_transactions(created_at, id);
+
+CREATE TABLE IF NOT EXISTS user_preferences (
+    id                  INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at          TEXT NOT NULL,
+    user_name           TEXT NOT NULL UNIQUE,
+    theme               TEXT,
+    emoji               TEXT,
+    title               TEXT,
+    ui_style            TEXT,
+    default_country     TEXT,
+    default_city        TEXT,
+    share_live_location INTEGER,
+    metadata            TEXT DEFAULT '{}'
+);
+"""
+
+JSON_COLUMNS = {"location", "metadata"}
+# Tables that only ever grow, so the change feed can tail them by id
+APPEND_ONLY_TABLES = {"clicks", "coin_transactions"}
+BOOL_COLUMNS = {"share_live_location"}
+
+def _now_iso() -> str:
+    return pd.Timestamp.now(tz="UTC").isoformat()
+
+class SQLiteBackend(StorageBackend):
+    """
+    In-process SQLite stand-in for Supabase with the same schema, for offline benchmarks,
+    scale tests and local fallback. Use path=":memory:" for a throwaway database.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.key = f"sqlite:{path}"
+        self.persistent = path != ":memory:"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(SQLITE_SCHEMA)
+
+    def _encode(self, row: dict) -> dict:
+        out = {}
+        for col, val in row.items():
+            if col in JSON_COLUMNS and val is not None:
+                val = json.dumps(val, ensure_ascii=False)
+            elif col in BOOL_COLUMNS and val is not None:
+                val = int(bool(val))
+            out[col] = val
+        return out
+
+    def _decode(self, row: sqlite3.Row) -> dict:
+        out = dict(row)
+        for col in JSON_COLUMNS & out.keys():
+            if out[col] is not None:
+                out[col] = json.loads(out[col])
+        for col in BOOL_COLUMNS & out.keys():
+            if out[col] is not None:
+                out[col] = bool(out[col])
+        return out
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return [self._decode(r) for r in self._conn.execute(sql, params).fetchall()]
+
+    def _where(self, filters: dict) -> tuple[str, list]:
+        if not filters:
+            return "", []
+        return " WHERE " + " AND ".join(f"{col} = ?" for col in filters), list(filters.values())
+
+    def fetch_rows(self, table: str, since=None, offset: int = 0, limit: int = 1000, columns: list = None) -> list:
+        sql = f"SELECT {', '.join(columns) if columns else '*'} FROM {table}"
+        params = []
+        if since is not None:
+            sql += " WHERE created_at >= ?"
+            params.append(since.isoformat())
+        sql += " ORDER BY created_at, id LIMIT ? OFFSET ?"
+        return self._query(sql, params + [limit, offset])
+
+    def count_rows(self, table: str, since=None) -> int:
+        sql = f"SELECT COUNT(*) AS n FROM {table}"
+        params = []
+        if since is not None:
+            sql += " WHERE created_at >= ?"
+            params.append(since.isoformat())
+        return self._query(sql, params)[0]["n"]
+
+    def select_where(self, table: str, filters: dict) -> list:
+        where, params = self._where(filters)
+        return self._query(f"SELECT * FROM {table}{where}", params)
+
+    def insert_rows(self, table: str, rows: list) -> list:
+        stored = []
+        with self._lock, self._conn:
+            for row in rows:
+                enc = self._encode({"created_at": _now_iso(), **row})
+                cols = list(enc)
+                sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) RETURNING *"
+                stored.extend(self._decode(r) for r in self._conn.execute(sql, [enc[c] for c in cols]).fetchall())
+        return stored
+
+    def update_rows(self, table: str, values: dict, filters: dict) -> list:
+        enc = self._encode(values)
+        where, params = self._where(filters)
+        sql = f"UPDATE {table} SET " + ", ".join(f"{col} = ?" for col in enc) + where + " RETURNING *"
+        with self._lock, self._conn:
+            return [self._decode(r) for r in self._conn.execute(sql, list(enc.values()) + params).fetchall()]
+
+    def upsert_preferences(self, prefs: list) -> list:
+        # Same semantics as the Postgres RPC: only the given columns are overwritten and
+        # json_set merges the metadata keys in place (a null value is stored, not deleted)
+        stored = []
+        with self._lock, self._conn:
+            for pref in prefs:
+                meta = pref.get("metadata") or {}
+                enc = self._encode({"created_at": _now_iso(), **{k: v for k, v in pref.items() if k != "metadata"}})
+                enc["metadata"] = json.dumps(meta, ensure_ascii=False)
+                cols = list(enc)
+                updates = [f"{c} = excluded.{c}" for c in cols if c not in ("user_name", "created_at", "metadata")]
+                merge_params = []
+                if meta:
+                    paths = ", ".join("?, json(?)" for _ in meta)
+                    updates.append(f"metadata = json_set(COALESCE(metadata, '{{}}'), {paths})")
+                    for k, v in meta.items():
+                        # Quoted path segment: metadata keys are plain names (dots are fine, double quotes are not)
+                        merge_params += [f'$."{k}"', json.dumps(v, ensure_ascii=False)]
+                sql = (
+                    f"INSERT INTO user_preferences ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+                    f"ON CONFLICT(user_name) DO UPDATE SET {', '.join(updates) or 'user_name = excluded.user_name'} RETURNING *"
+                )
+                stored.extend(self._decode(r) for r in self._conn.execute(sql, [enc[c] for c in cols] + merge_params).fetchall())
+        return stored
+
+    def aggregate_clicks(self) -> list:
+        return self._query(
+            "SELECT user_name, COALESCE(drink_id, 1) AS drink_id, COUNT(*) AS clicks, COALESCE(SUM(value), 0) AS value "
+            "FROM clicks GROUP BY user_name, COALESCE(drink_id, 1)"
+        )
+
+    def aggregate_transactions(self) -> list:
+        return self._query(
+            "SELECT user_name, transaction_type, COUNT(*) AS transactions, COALESCE(SUM(amount), 0) AS amount "
+            "FROM coin_transactions GROUP BY user_name, transaction_type"
+        )
+
+    def has_columns(self, table: str, columns: list) -> bool:
+        with self._lock:
+            existing = {r["name"] for r in self._conn.execute(f"PRAGMA table_info({table})").fetchall()}
+        return set(columns).issubset(existing)
+
+    def watch(self, tables: list, on_change, interval: float = 1.0) -> None:
+        # Local stand-in for realtime: a daemon thread tails the database file, so rows written by
+        # other processes show up too. Append-only tables are read past their last seen id; the
+        # others are compared against their previous contents.
+        last_ids = {t: self._query(f"SELECT COALESCE(MAX(id), 0) AS n FROM {t}")[0]["n"] for t in tables if t in APPEND_ONLY_TABLES}
+        last_rows = {t: self._query(f"SELECT * FROM {t}") for t in tables if t not in APPEND_ONLY_TABLES}
+
+        def tail():
+            while True:
+                time.sleep(interval)
+                try:
+                    for table in last_ids:
+                        rows = self._query(f"SELECT * FROM {table} WHERE id > ? ORDER BY id", (last_ids[table],))
+                        if rows:
+                            last_ids[table] = rows[-1]["id"]
+                            on_change(table, rows)
+                    for table in last_rows:
+                        rows = self._query(f"SELECT * FROM {table}")
+                        changed = [r for r in rows if r not in last_rows[table]]
+                        last_rows[table] = rows
+                        if changed:
+                            on_change(table, changed)
+                except Exception:
+                    continue
+
+        threading.Thread(target=tail, name=f"sqlite-change-feed:{self.path}", daemon=True).start()
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+from storage.base import StorageBackend
+
+class SupabaseBackend(StorageBackend):
+    """Storage backend talking to the live Supabase project through its PostgREST client."""
+
+    def __init__(self, client, url: str = ""):
+        self.client = client
+        self.key = f"supabase:{url}"
+
+    def fetch_rows(self, table: str, since=None, offset: int = 0, limit: int = 1000, columns: list = None) -> list:
+        query = self.client.table(table).select(",".join(columns) if columns else "*")
+        if since is not None:
+            query = query.gte("created_at", since.isoformat())
+        response = query.order("created_at").order("id").range(offset, offset + limit - 1).execute()
+        return response.data or []
+
+    def count_rows(self, table: str, since=None) -> int:
+        # HEAD request: PostgREST only returns the exact count in the Content-Range header
+        query = self.client.table(table).select("id", count="exact", head=True)
+        if since is not None:
+            query = query.gte("created_at", since.isoformat())
+        return query.execute().count or 0
+
+    def select_where(self, table: str, filters: dict) -> list:
+        query = self.client.table(table).select("*")
+        for col, val in filters.items():
+            query = query.eq(col, val)
+        return query.execute().data or []
+
+    def insert_rows(self, table: str, rows: list) -> list:
+        return self.client.table(table).insert(rows).execute().data or []
+
+    def update_rows(self, table: str, values: dict, filters: dict) -> list:
+        query = self.client.table(table).update(values)
+        for col, val in filters.items():
+            query = query.eq(col, val)
+        return query.execute().data or []
+
+    def upsert_preferences(self, prefs: list) -> list:
+        # INSERT ... ON CONFLICT with a JSONB merge (see docs/02_DATA_MODELS.md, "Preference upsert RPC")
+        return self.client.rpc("upsert_user_preferences", {"prefs": prefs}).execute().data or []
+
+    def aggregate_clicks(self) -> list:
+        # Server-side GROUP BY (see docs/02_DATA_MODELS.md, "Aggregation RPCs")
+        return self.client.rpc("click_totals").execute().data or []
+
+    def aggregate_transactions(self) -> list:
+        return self.client.rpc("transaction_totals").execute().data or []
+
+    def has_columns(self, table: str, columns: list) -> bool:
+        # A zero-row projected read fails with Postgres 42703 (undefined_column) when any column is unknown
+        try:
+            self.client.table(table).select(",".join(columns)).limit(0).execute()
+            return True
+        except Exception as e:
+            if getattr(e, "code", None) == "42703" or "does not exist" in str(e):
+                return False
+            raise
+
+    def watch(self, tables: list, on_change, timeout: float = 10.0) -> None:
+        # Postgres changes over Supabase Realtime (tables must be in the supabase_realtime
+        # publication, see docs/02_DATA_MODELS.md). supabase-py only ships an async realtime
+        # client, so it runs on its own event loop in a daemon thread.
+        from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
+
+        realtime_url = str(self.client.realtime_url)
+        api_key = self.client.supabase_key
+        ready = threading.Event()
+        status = {}
+
+        def forward(table):
+            def callback(payload):
+                record = (payload.get("data") or {}).get("record")
+                if record:
+                    on_change(table, [record])
+            return callback
+
+        def on_subscribe(state, error):
+            status["state"], status["error"] = state, error
+            ready.set()
+
+        async def listen():
+            try:
+                socket = AsyncRealtimeClient(realtime_url, token=api_key, auto_reconnect=True)
+                await socket.connect()
+                channel = socket.channel("db-changes")
+                for table in tables:
+                    channel.on_postgres_changes("*", callback=forward(table), table=table, schema="public")
+                await channel.subscribe(on_subscribe)
+            except Exception as e:
+                status["error"] = e
+                ready.set()
+                return
+            # The client's listen and heartbeat tasks live on this loop; keep it running
+            await asyncio.Event().wait()
+
+        threading.Thread(target=lambda: asyncio.run(listen()), name="supabase-change-feed", daemon=True).start()
+        if not ready.wait(timeout) or status.get("state") != RealtimeSubscribeStates.SUBSCRIBED:
+            raise ConnectionError(f"Realtime subscription failed: {status.get('error') or 'timed out'}")
@@ -0,0 +1,143 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import pandas as pd
+from storage.resilience import CircuitOpenError, is_transient
+
+class WriteQueue:
+    """
+    Durable write-ahead journal (a SQLite table) drained by a background flusher.
+    enqueue() commits the payload locally and returns at once; the flusher hands entries to
+    `flush(entry_id, payload, checkpoint)` in FIFO order and retries failures with jittered
+    exponential backoff. `checkpoint(payload)` lets flush persist the part still left to write,
+    so a retry after a partial failure does not repeat the steps that already went through.
+    An entry that fails for good (a non-transient error, or `max_attempts` failures) is moved to the
+    dead-letter state so the entries behind it keep draining; `on_dead(entry_id, payload, error)` is
+    called for it and dead_letters() lists them.
+    """
+
+    def __init__(self, path: str, flush, base_delay: float = 1.0, max_delay: float = 300.0,
+                 max_attempts: int = 30, on_dead=None):
+        self.path = path
+        self.flush = flush
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.on_dead = on_dead
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL, payload TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0, last_error TEXT, "
+                "dead INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(journal)").fetchall()}
+            if "dead" not in columns:
+                # Journal written before the dead-letter state existed
+                self._conn.execute("ALTER TABLE journal ADD COLUMN dead INTEGER NOT NULL DEFAULT 0")
+
+    def enqueue(self, payload: dict, on_recorded=None) -> int:
+        """
+        Durably records a payload and wakes the flusher; returns the journal entry id.
+        on_recorded(entry_id) runs before the flusher can see the entry.
+        """
+        with self._lock:
+            with self._conn:
+                cur = self._conn.execute(
+                    "INSERT INTO journal (created_at, payload) VALUES (?, ?)",
+                    (pd.Timestamp.now(tz="UTC").isoformat(), json.dumps(payload, ensure_ascii=False))
+                )
+            if on_recorded is not None:
+                on_recorded(cur.lastrowid)
+        self._wake.set()
+        return cur.lastrowid
+
+    def pending(self) -> list:
+        """(entry id, payload) of everything still to be flushed, oldest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, payload FROM journal WHERE dead = 0 ORDER BY id").fetchall()
+        return [(entry_id, json.loads(payload)) for entry_id, payload in rows]
+
+    def dead_letters(self) -> list:
+        """Entries set aside after failing for good, oldest first: id, created_at, payload, attempts and last_error."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, created_at, payload, attempts, last_error FROM journal WHERE dead = 1 ORDER BY id"
+            ).fetchall()
+        return [
+            {"id": entry_id, "created_at": created_at, "payload": json.loads(payload), "attempts": attempts, "last_error": last_error}
+            for entry_id, created_at, payload, attempts, last_error in rows
+        ]
+
+    def stats(self) -> dict:
+        """Journal health: entries waiting (and their worst retry count / latest error) and dead letters."""
+        with self._lock:
+            count, attempts, last_error = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(attempts), 0), MAX(last_error) FROM journal WHERE dead = 0"
+            ).fetchone()
+            dead = self._conn.execute("SELECT COUNT(*) FROM journal WHERE dead = 1").fetchone()[0]
+        return {"pending": count, "max_attempts": attempts, "last_error": last_error, "dead": dead}
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"write-queue:{self.path}", daemon=True)
+            self._thread.start()
+
+    def _checkpoint(self, entry_id: int):
+        def checkpoint(payload: dict):
+            with self._lock, self._conn:
+                self._conn.execute("UPDATE journal SET payload = ? WHERE id = ?", (json.dumps(payload, ensure_ascii=False), entry_id))
+        return checkpoint
+
+    def _drain(self) -> float:
+        """Flushes due entries in order; returns seconds until the next retry is due (None when empty)."""
+        while True:
+            with self._lock:
+                head = self._conn.execute(
+                    "SELECT id, payload, attempts, next_attempt FROM journal WHERE dead = 0 ORDER BY id LIMIT 1"
+                ).fetchone()
+            if head is None:
+                return None
+            entry_id, payload, attempts, next_attempt = head
+            wait = next_attempt - time.time()
+            if wait > 0:
+                return wait
+            payload = json.loads(payload)
+            try:
+                self.flush(entry_id, payload, self._checkpoint(entry_id))
+            except Exception as e:
+                if not (isinstance(e, CircuitOpenError) or is_transient(e)) or attempts + 1 >= self.max_attempts:
+                    # Retrying cannot fix it: set the entry aside so the ones behind it are not blocked
+                    with self._lock, self._conn:
+                        self._conn.execute(
+                            "UPDATE journal SET dead = 1, attempts = attempts + 1, last_error = ? WHERE id = ?",
+                            (f"{type(e).__name__}: {e}"[:500], entry_id)
+                        )
+                    if self.on_dead is not None:
+                        self.on_dead(entry_id, payload, e)
+                    continue
+                # Jittered exponential backoff; later entries wait behind the head to keep tap order
+                delay = min(self.max_delay, self.base_delay * 2 ** attempts) * random.uniform(0.5, 1.0)
+                with self._lock, self._conn:
+                    self._conn.execute(
+                        "UPDATE journal SET attempts = attempts + 1, next_attempt = ?, last_error = ? WHERE id = ?",
+                        (time.time() + delay, str(e)[:500], entry_id)
+                    )
+                continue
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM journal WHERE id = ?", (entry_id,))
+
+    def _run(self) -> None:
+        while True:
+            try:
+                wait = self._drain()
+            except Exception:
+                wait = self.base_delay
+            self._wake.wait(timeout=wait)
+            self._wake.clear()
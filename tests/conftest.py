@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The app modules live at the repository root (Streamlit runs the pages from there)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Every test runs against a throwaway in-process SQLite backend (nothing mirrored or journaled to disk)
+os.environ.setdefault("COFFEE_STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("COFFEE_STORAGE_SQLITE_PATH", ":memory:")
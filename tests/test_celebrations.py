@@ -0,0 +1,54 @@
+import pandas as pd
+from components.celebrations import CROWN_TITLES, _user_crowns, get_unlock_delta
+from gamification.progress import CrewProgress
+
+USERS = ["Cris", "Bea", "Fer"]
+
+def test_user_crowns_matches_name_and_dict_holders():
+    trophies = {
+        "caffeine_addict": "Cris",
+        "tea_purist": "Bea",
+        "ice_monarch": {"user": "Cris", "count": 4},
+        "combustion_monarch": {"user": "Fer", "count": 2}
+    }
+    assert _user_crowns("Cris", trophies) == {CROWN_TITLES["caffeine_addict"], CROWN_TITLES["ice_monarch"]}
+    assert _user_crowns("Bea", trophies) == {CROWN_TITLES["tea_purist"]}
+    assert _user_crowns("Fer", trophies) == {CROWN_TITLES["combustion_monarch"]}
+
+def test_user_crowns_without_holders():
+    trophies = {key: None for key in CROWN_TITLES}
+    assert _user_crowns("Cris", trophies) == set()
+
+def test_unlock_delta_reports_a_taken_ice_crown():
+    now = pd.Timestamp.now(tz="UTC")
+    progress = CrewProgress(USERS, achievements_start_date=now - pd.Timedelta(days=1))
+    progress.fold_click({"user_name": "Bea", "drink_id": 3, "value": 1, "created_at": (now - pd.Timedelta(hours=3)).isoformat()})
+    progress.fold_click({"user_name": "Cris", "drink_id": 3, "value": 1, "created_at": (now - pd.Timedelta(hours=2)).isoformat()})
+
+    delta = get_unlock_delta("Cris", progress, [
+        {"user_name": "Cris", "drink_id": 3, "value": 1, "created_at": (now - pd.Timedelta(hours=1)).isoformat()}
+    ])
+    assert CROWN_TITLES["ice_monarch"] in delta["crowns"]
+
+def test_tap_on_the_shared_frame_folds_only_the_new_row(monkeypatch):
+    import database
+    from data_processing import process_raw_data
+    from gamification.progress import get_crew_progress
+
+    start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=20)
+    database.get_backend().backend.insert_rows("clicks", [
+        {"user_name": "Fer", "value": 1, "drink_id": 1 + i % 4, "created_at": (start + pd.Timedelta(hours=3 * i)).isoformat()}
+        for i in range(60)
+    ])
+    df = process_raw_data(database.get_data(), USERS)[0]
+    get_crew_progress(df, USERS)
+
+    folds = []
+    original_fold = CrewProgress.fold
+    monkeypatch.setattr(CrewProgress, "fold", lambda self, *args, **kwargs: folds.append(args) or original_fold(self, *args, **kwargs))
+
+    batch = database.WriteBatch()
+    batch.add_click("Fer", 1, 3)
+    delta = get_unlock_delta("Fer", get_crew_progress(df, USERS), batch.pending_rows("clicks"))
+    assert delta is not None
+    assert len(folds) == 1
@@ -0,0 +1,69 @@
+import sqlite3
+import pandas as pd
+import database
+from data_processing import get_daily_rollup, process_raw_data
+
+USERS = ["Cris", "Bea", "Fer"]
+
+def _bea_rows():
+    return sorted((r["id"], r["drink_id"]) for r in database.get_data() if r.get("user_name") == "Bea")
+
+def test_clear_all_db_caches_resyncs_updated_and_deleted_rows(monkeypatch):
+    # Rows are written straight to the backend, behind the mirror: re-read it on every call
+    monkeypatch.setattr(database, "SYNC_INTERVAL", 0)
+    backend = database.get_backend().backend
+    start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=3)
+    stored = backend.insert_rows("clicks", [
+        {"user_name": "Bea", "value": 1, "drink_id": 1, "created_at": (start + pd.Timedelta(hours=i)).isoformat()}
+        for i in range(3)
+    ])
+    df = process_raw_data(database.get_data(), USERS)[0]
+    before = get_daily_rollup(df)
+    assert _bea_rows() == [(r["id"], 1) for r in stored]
+
+    backend.update_rows("clicks", {"drink_id": 2}, {"id": stored[0]["id"]})
+    with backend._lock, backend._conn:
+        backend._conn.execute("DELETE FROM clicks WHERE id = ?", (stored[1]["id"],))
+    database.clear_all_db_caches()
+
+    assert _bea_rows() == [(stored[0]["id"], 2), (stored[2]["id"], 1)]
+    df = process_raw_data(database.get_data(), USERS)[0]
+    # Rebuilt from the re-read rows, not folded on top of the pre-clear rollup
+    pd.testing.assert_frame_equal(get_daily_rollup(df), get_daily_rollup(df.copy()), check_like=True)
+    assert not get_daily_rollup(df).equals(before)
+
+def test_persisted_mirror_is_rebuilt_under_another_stamp(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "_MIRROR_FILE", str(tmp_path / "mirror.sqlite3"))
+    rows = [{"id": 1, "created_at": "2026-01-01T00:00:00+00:00", "user_name": "Bea"}]
+    high_water = pd.Timestamp(rows[0]["created_at"])
+    stamp = database._mirror_stamp("coin_transactions")
+    database._save_mirror_to_disk("test/coin_transactions", rows, high_water, stamp)
+
+    assert database._load_mirror_from_disk("test/coin_transactions", stamp) == (rows, high_water)
+    assert database._load_mirror_from_disk("test/coin_transactions", stamp + " ") == ([], None)
+    # Dropped, not just skipped
+    assert database._load_mirror_from_disk("test/coin_transactions", stamp) == ([], None)
+
+def test_unstamped_mirror_file_is_rebuilt(monkeypatch, tmp_path):
+    path = tmp_path / "mirror.sqlite3"
+    monkeypatch.setattr(database, "_MIRROR_FILE", str(path))
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE mirror_state (table_name TEXT PRIMARY KEY, high_water TEXT)")
+        conn.execute("INSERT INTO mirror_state VALUES ('test/coin_transactions', '2026-01-01T00:00:00+00:00')")
+    conn.close()
+
+    assert database._load_mirror_from_disk("test/coin_transactions", database._mirror_stamp("coin_transactions")) == ([], None)
+
+def test_late_flush_keeps_the_tap_time_in_transaction_metadata():
+    late = (pd.Timestamp.now(tz="UTC") - database.JOURNAL_BACKDATE_LIMIT * 2).isoformat()
+    fresh = pd.Timestamp.now(tz="UTC").isoformat()
+    tx = {"user_name": "Bea", "amount": 1, "transaction_type": "drink_reward", "metadata": {"drink_id": 1}}
+
+    stamped = database._stamp_for_flush([{**tx, "created_at": late}, {**tx, "created_at": fresh}])
+    assert "created_at" not in stamped[0]
+    assert stamped[0]["metadata"] == {"drink_id": 1, "tapped_at": late}
+    assert stamped[1] == {**tx, "created_at": fresh}
+    assert database._stamp_for_flush([{"user_name": "Bea", "value": 1, "drink_id": 1, "created_at": late}]) == [
+        {"user_name": "Bea", "value": 1, "drink_id": 1}
+    ]
@@ -0,0 +1,37 @@
+import pathlib
+import pandas as pd
+import pytest
+
+pytest.importorskip("randfacts")
+from streamlit.testing.v1 import AppTest
+import database
+from data_processing import process_raw_data
+from gamification.progress import CrewProgress, get_crew_progress, _get_progress_store
+
+HOME_PAGE = pathlib.Path(__file__).resolve().parent.parent / "0_Coffee_is_my_best_friend_：).py"
+USERS = ["Cris", "Bea", "Fer"]
+
+def test_tap_folds_into_the_stored_crew_progress(monkeypatch):
+    start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=30)
+    database.get_backend().backend.insert_rows("clicks", [
+        {"user_name": USERS[i % 3], "value": 1, "drink_id": 1 + i % 4, "created_at": (start + pd.Timedelta(hours=5 * i)).isoformat()}
+        for i in range(120)
+    ])
+    # Warm the running state the way a previous tap would have
+    stored = len(database.get_data())
+    get_crew_progress(process_raw_data(database.get_data(), USERS)[0], USERS)
+
+    folds = []
+    original_fold = CrewProgress.fold
+    monkeypatch.setattr(CrewProgress, "fold", lambda self, *args, **kwargs: folds.append(args) or original_fold(self, *args, **kwargs))
+    monkeypatch.setattr(CrewProgress, "from_frame", classmethod(lambda cls, *args, **kwargs: pytest.fail("full refold on a tap")))
+
+    at = AppTest.from_file(str(HOME_PAGE), default_timeout=120)
+    at.query_params["user"] = "Cris"
+    at.run()
+    at.button(key="btn_hot_coffee").click().run()
+
+    assert not at.exception
+    # Only the tapped (queued) click was folded, on top of the stored state of the synced rows
+    assert len(folds) == 1
+    assert list(_get_progress_store()["entries"].values())[-1]["rows"] == stored
@@ -0,0 +1,51 @@
+import random
+import pandas as pd
+from data_processing import process_raw_data, get_gamification_metrics
+from gamification.progress import CrewProgress
+
+USERS = ["Cris", "Bea", "Fer"]
+PLACES = [("ES", "Madrid"), ("FR", "Paris"), ("JP", "Kyoto"), ("PLANE", "Flight"), ("ES", "Barcelona")]
+
+def _history(n=1500, days=120, seed=7):
+    """Clicks spread over the last `days` days (before and after the achievements release), with bursts and travel."""
+    rnd = random.Random(seed)
+    end = pd.Timestamp.now(tz="UTC")
+    minutes = sorted(rnd.randrange(days * 24 * 60) for _ in range(n))
+    rows = []
+    for i, m in enumerate(minutes):
+        row = {
+            "id": i + 1,
+            "created_at": (end - pd.Timedelta(minutes=days * 24 * 60 - m)).isoformat(),
+            "user_name": rnd.choice(USERS),
+            "value": 1,
+            "drink_id": rnd.choice([1, 1, 2, 3, 4, 1, 3])
+        }
+        if rnd.random() < 0.5:
+            country, city = rnd.choice(PLACES)
+            row["location"] = {"country": country, "city": city}
+        rows.append(row)
+    transactions = [
+        {"id": r["id"], "created_at": r["created_at"], "user_name": r["user_name"], "amount": 10,
+         "transaction_type": "drink_log", "metadata": {"drink_id": r["drink_id"]}}
+        for r in rows
+    ]
+    return rows, transactions
+
+def test_trophies_match_the_engine():
+    rows, transactions = _history()
+    df, df_coffee, df_tea, _, _ = process_raw_data(rows, USERS)
+    expected = get_gamification_metrics(df_coffee, df_tea, USERS, transactions=transactions)
+
+    trophies = CrewProgress.from_frame(df, USERS).trophies(transactions)
+    assert trophies == {key: expected.get(key) for key in trophies}
+
+def test_folded_trophies_match_the_engine():
+    rows, transactions = _history(n=400, days=40, seed=3)
+    progress = CrewProgress.from_frame(process_raw_data(rows[:-25], USERS)[0], USERS)
+    for row in rows[-25:]:
+        assert progress.fold_click(row)
+
+    _, df_coffee, df_tea, _, _ = process_raw_data(rows, USERS)
+    expected = get_gamification_metrics(df_coffee, df_tea, USERS, transactions=transactions)
+    trophies = progress.trophies(transactions)
+    assert trophies == {key: expected.get(key) for key in trophies}
@@ -629,7 +629,8 @@ def compute_passport_stats(
     valid_txs = []
     if clicks_data is not None:
         if isinstance(clicks_data, pd.DataFrame):
-            clicks_list = clicks_data.to_dict('records')
+            # Missing cells of the categorical country/city columns come out as NaN, which is truthy
+            clicks_list = clicks_data.astype(object).where(clicks_data.notna(), None).to_dict('records')
         elif isinstance(clicks_data, list):
             clicks_list = clicks_data
         else: